@@ -0,0 +1,59 @@
+"""Сравнение двух результатов benchmarks.feeds.
+
+Запуск: python -m benchmarks.compare old.json new.json [--threshold 0.1]
+
+Печатает изменение медианы, p90 и числа запросов по каждой странице и
+завершается с кодом 1, если медиана выросла больше порога или страница
+стала делать больше запросов.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(old, new, threshold):
+    rows, regressions = [], []
+    for view, modes in new['results'].items():
+        for mode, result in modes.items():
+            before = old['results'].get(view, {}).get(mode)
+            if before is None:
+                continue
+            change = result['p50_ms'] / before['p50_ms'] - 1
+            rows.append((f'{view}/{mode}', before['p50_ms'],
+                         result['p50_ms'], change, before['p90_ms'],
+                         result['p90_ms'], before['queries_mean'],
+                         result['queries_mean']))
+            if (change > threshold
+                    or result['queries_mean'] > before['queries_mean']):
+                regressions.append(f'{view}/{mode}')
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Допустимый рост медианы, доля')
+    args = parser.parse_args(argv)
+    old, new = load(args.old), load(args.new)
+    rows, regressions = compare(old, new, args.threshold)
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    print(f"{'страница':<22}{'p50':>18}{'изм.':>9}{'p90':>18}"
+          f"{'запросы':>14}")
+    for name, p50_old, p50_new, change, p90_old, p90_new, q_old, q_new \
+            in rows:
+        print(f'{name:<22}{p50_old:>8.2f} → {p50_new:<7.2f}{change:>+9.1%}'
+              f'{p90_old:>8.2f} → {p90_new:<7.2f}{q_old:>6} → {q_new:<5}')
+    if regressions:
+        print('Регрессии: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
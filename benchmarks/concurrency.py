@@ -0,0 +1,160 @@
+"""Пропускная способность SQLite при одновременных чтении и записи.
+
+Запуск: python -m benchmarks.concurrency [--readers 8] [--writers 2]
+[--seconds 10]
+
+Потоки-читатели запрашивают ленту и страницы записей через WSGIHandler,
+как сервер: соединения с базой закрываются и переиспользуются по
+CONN_MAX_AGE. Потоки-писатели в это же время добавляют комментарии.
+Замер делается дважды на одних данных: со стандартным sqlite3 без
+прагм и постоянных соединений (stock) и с настройками проекта (project).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from benchmarks.db import test_database
+from benchmarks.feeds import percentile
+from benchmarks.seed import Dataset, seed
+
+STOCK = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'CONN_MAX_AGE': 0,
+    'CONN_HEALTH_CHECKS': False,
+    'OPTIONS': {},
+}
+
+
+class Worker(threading.Thread):
+    def __init__(self, action, deadline, seed):
+        super().__init__()
+        self.action = action
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        from django.db import connections
+
+        try:
+            while time.perf_counter() < self.deadline:
+                started = time.perf_counter()
+                if self.action(self.rng):
+                    self.latencies.append(time.perf_counter() - started)
+                else:
+                    self.errors += 1
+        finally:
+            connections.close_all()
+
+
+def reader(urls):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+
+    handler = WSGIHandler()
+    factory = RequestFactory()
+
+    def read(rng):
+        environ = factory.get(rng.choice(urls)).environ
+        status = []
+        response = handler(environ, lambda code, headers: status.append(code))
+        b''.join(response)
+        response.close()
+        return status[0].startswith('200')
+
+    return read
+
+
+def writer(posts, authors):
+    from django.core.signals import request_finished, request_started
+    from django.db import DatabaseError
+
+    from posts.models import Comment
+
+    def write(rng):
+        request_started.send(sender=None)
+        try:
+            Comment.objects.create(post_id=rng.choice(posts),
+                                   author_id=rng.choice(authors),
+                                   text='Комментарий из бенчмарка')
+            return True
+        except DatabaseError:
+            return False
+        finally:
+            request_finished.send(sender=None)
+
+    return write
+
+
+def summarize(workers, elapsed):
+    latencies_ms = [latency * 1000 for worker in workers
+                    for latency in worker.latencies]
+    return {
+        'operations': len(latencies_ms),
+        'errors': sum(worker.errors for worker in workers),
+        'per_second': round(len(latencies_ms) / elapsed, 1),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+    }
+
+
+def run(args, read, write):
+    deadline = time.perf_counter() + args.seconds
+    readers = [Worker(read, deadline, i) for i in range(args.readers)]
+    writers = [Worker(write, deadline, -i - 1) for i in range(args.writers)]
+    started = time.perf_counter()
+    for worker in readers + writers:
+        worker.start()
+    for worker in readers + writers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return {'reads': summarize(readers, elapsed),
+            'writes': summarize(writers, elapsed)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args(argv)
+    with test_database() as connection:
+        from django.db import connections
+        from django.urls import reverse
+
+        from posts.models import Post, User
+
+        seed(Dataset(users=200, posts=2000, images=0))
+        posts = list(Post.objects.select_related('author')[:200])
+        urls = [reverse('index')] + [
+            reverse('post_view', args=[post.author.username, post.pk])
+            for post in posts]
+        authors = list(User.objects.values_list('pk', flat=True)[:200])
+        read = reader(urls)
+        write = writer([post.pk for post in posts], authors)
+
+        project = connections.databases['default']
+        profiles = {'stock': {**project, **STOCK}, 'project': project}
+        results = {}
+        for name, profile in profiles.items():
+            if name == 'stock':
+                # WAL сохраняется в файле базы: возвращаем журнал по
+                # умолчанию
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode = DELETE')
+            # Потоки создают соединения по connections.databases
+            connections.databases['default'] = profile
+            try:
+                results[name] = run(args, read, write)
+            finally:
+                connections.databases['default'] = project
+    print(json.dumps({'readers': args.readers, 'writers': args.writers,
+                      'seconds': args.seconds, 'results': results},
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Отдельная тестовая база для бенчмарков, которым нужны данные.
+
+Бенчмарк не трогает рабочую базу: создается тестовая база (для SQLite —
+файл рядом с рабочей, с префиксом test_), в нее применяются миграции,
+после замеров база удаляется. Окружение настраивается как в тестах:
+DEBUG выключен, тестовый клиент принимается ALLOWED_HOSTS.
+"""
+import contextlib
+import os
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(keepdb=False):
+    setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import (setup_test_environment,
+                                   teardown_test_environment)
+
+    test_name = settings.DATABASES['default'].setdefault('TEST', {})
+    if connection.vendor == 'sqlite' and not test_name.get('NAME'):
+        # Файловая база вместо :memory:, чтобы замеры были честнее
+        name = settings.DATABASES['default']['NAME']
+        test_name['NAME'] = os.path.join(os.path.dirname(name),
+                                         'test_benchmark.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment(debug=False)
+    test_db = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0,
+                                            keepdb=keepdb)
+        teardown_test_environment()
+        if connection.vendor == 'sqlite' and not keepdb:
+            # Журнал WAL остается, если соединения потоков бенчмарка
+            # еще открыты
+            for suffix in ('-wal', '-shm'):
+                with contextlib.suppress(OSError):
+                    os.remove(test_db + suffix)
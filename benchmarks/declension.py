@@ -0,0 +1,45 @@
+"""Сравнение склонения через pymorphy2 на каждый вызов и через кэш форм.
+
+Запуск: python -m benchmarks.declension
+"""
+import json
+import time
+import timeit
+
+from users import declension
+
+WORDS = ('комментарий', 'подписчик', 'запись', 'сообщество')
+COUNTS = (0, 1, 2, 5, 11, 21, 104, 112)
+NUMBER = 2000
+
+
+def main():
+    started = time.perf_counter()
+    morph = declension.get_morph()
+    load = time.perf_counter() - started
+
+    def before():
+        for word in WORDS:
+            for count in COUNTS:
+                morph.parse(word)[0].make_agree_with_number(count).word
+
+    def after():
+        for word in WORDS:
+            for count in COUNTS:
+                declension.agree_with_number(count, word)
+
+    calls = NUMBER * len(WORDS) * len(COUNTS)
+    results = {
+        'analyzer_load_s': round(load, 4),
+        'before_us_per_call': timeit.timeit(before, number=NUMBER)
+        / calls * 1e6,
+        'after_us_per_call': timeit.timeit(after, number=NUMBER)
+        / calls * 1e6,
+    }
+    results['speedup'] = (results['before_us_per_call']
+                          / results['after_us_per_call'])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Задержки, число запросов и пропускная способность страниц ленты.
+
+Запуск: python -m benchmarks.feeds [--posts 10000] [--output result.json]
+
+Каждая страница запрашивается тестовым клиентом Django в двух режимах:
+cold — кэш очищается перед каждым запросом, warm — кэш не трогается.
+Результат — JSON, который можно сравнить с прошлым запуском через
+python -m benchmarks.compare.
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from benchmarks.db import test_database
+from benchmarks.seed import PASSWORD, Dataset, seed
+
+VIEWS = ('index', 'group_posts', 'profile', 'post_view', 'follow_index',
+         'add_comment')
+MODES = ('cold', 'warm')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def summarize(latencies, queries, elapsed):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p90_ms': round(percentile(latencies_ms, 90), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 3),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+@contextmanager
+def count_queries(counter):
+    from django.db import connection
+
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def requests_for(view, rng, ids):
+    """Бесконечный поток (метод, адрес, данные) для страницы."""
+    from django.urls import reverse
+
+    from posts.models import Group, Post, User
+
+    usernames = dict(User.objects.filter(pk__in=ids['users'])
+                     .values_list('pk', 'username'))
+    slugs = list(Group.objects.values_list('slug', flat=True))
+    posts = list(Post.objects.filter(pk__in=rng.sample(
+        ids['posts'], min(1000, len(ids['posts']))))
+        .values_list('pk', 'author__username'))
+    while True:
+        if view == 'index':
+            yield 'get', reverse('index'), None
+        elif view == 'group_posts':
+            yield 'get', reverse('group_posts',
+                                 args=[rng.choice(slugs)]), None
+        elif view == 'profile':
+            yield 'get', reverse('profile', args=[
+                usernames[rng.choice(ids['users'][:100])]]), None
+        elif view == 'post_view':
+            post_id, username = rng.choice(posts)
+            yield 'get', reverse('post_view', args=[username, post_id]), None
+        elif view == 'follow_index':
+            yield 'get', reverse('follow_index'), None
+        elif view == 'add_comment':
+            post_id, username = rng.choice(posts)
+            yield 'post', reverse('add_comment', args=[username, post_id]), {
+                'text': 'Комментарий из бенчмарка'}
+
+
+def run_view(client, view, mode, rng, ids, requests):
+    from django.core.cache import cache
+
+    stream = requests_for(view, rng, ids)
+    latencies, queries = [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        method, url, data = next(stream)
+        if mode == 'cold':
+            cache.clear()
+        counter = [0]
+        with count_queries(counter):
+            request_started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            latencies.append(time.perf_counter() - request_started)
+        if response.status_code not in (200, 302):
+            raise RuntimeError(f'{url}: {response.status_code}')
+        queries.append(counter[0])
+    return summarize(latencies, queries, time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    defaults = Dataset()
+    for field, value in defaults.as_dict().items():
+        parser.add_argument(f'--{field.replace("_", "-")}',
+                            type=type(value), default=value)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Запросов на страницу и режим')
+    parser.add_argument('--views', nargs='+', choices=VIEWS, default=VIEWS)
+    parser.add_argument('--output', help='Файл для JSON вместо stdout')
+    args = parser.parse_args(argv)
+    dataset = Dataset(**{field: getattr(args, field)
+                         for field in defaults.as_dict()})
+
+    media_root = tempfile.mkdtemp()
+    try:
+        with test_database():
+            from django.conf import settings
+            from django.test import Client, override_settings
+
+            from posts.models import User
+
+            with override_settings(MEDIA_ROOT=media_root,
+                                   POST_IMAGE_ASYNC=False):
+                started = time.perf_counter()
+                ids = seed(dataset)
+                seed_time = time.perf_counter() - started
+                # Самый активный читатель: больше всего подписок
+                reader = (User.objects.order_by('-stats__following_count')
+                          .first())
+                client = Client()
+                client.login(username=reader.username, password=PASSWORD)
+                rng = random.Random(dataset.seed)
+                results = {}
+                for view in args.views:
+                    results[view] = {}
+                    for mode in MODES:
+                        # Прогрев: загрузка шаблонов и анализатора pymorphy2
+                        run_view(client, view, mode, rng, ids, 5)
+                        results[view][mode] = run_view(
+                            client, view, mode, rng, ids, args.requests)
+                backend = settings.DATABASES['default']['ENGINE']
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': backend,
+            'dataset': dataset.as_dict(),
+            'seed_s': round(seed_time, 2),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Пропускная способность очереди фоновых задач.
+
+Запуск: python -m benchmarks.jobs [--jobs 2000] [--processes 2 4]
+[--work-ms 0]
+
+В очередь ставится --jobs задач, каждая из которых занимает процесс
+--work-ms миллисекунд, и обработчик выполняет их до опустения очереди.
+При --work-ms 0 измеряются накладные расходы самой очереди: выборка,
+отметка и удаление задач и передача в пул процессов.
+"""
+import argparse
+import json
+import time
+
+from benchmarks.db import test_database
+
+
+def work(ms):
+    # Задача не обращается к базе: дочерние процессы запускаются через
+    # spawn и не знают о тестовой базе бенчмарка
+    time.sleep(ms / 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--work-ms', type=float, default=0)
+    args = parser.parse_args(argv)
+    with test_database():
+        from django.db import transaction
+
+        from jobs.queue import enqueue
+        from jobs.worker import Worker
+
+        results = {}
+        for processes in args.processes:
+            started = time.perf_counter()
+            with transaction.atomic():
+                for _ in range(args.jobs):
+                    enqueue('benchmarks.jobs.work', ms=args.work_ms)
+            enqueue_s = time.perf_counter() - started
+            stats = Worker(processes).run(once=True, idle_sleep=0.05)
+            report = stats.report()
+            report['enqueue_per_s'] = round(args.jobs / enqueue_s, 1)
+            results[processes] = report
+    print(json.dumps({'jobs': args.jobs, 'work_ms': args.work_ms,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Накладные расходы MetricsMiddleware и инструментированных кэша и шаблонов.
+
+Запуск: python -m benchmarks.metrics [--requests 500]
+
+Одни и те же страницы запрашиваются попеременно с метриками и без них;
+сравниваются медианы. Завершается с кодом 1, если разница больше
+BUDGET_US микросекунд на запрос.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from benchmarks.db import test_database
+from benchmarks.seed import Dataset, seed
+
+BUDGET_US = 300
+BLOCK = 50
+
+
+def plain_settings(settings):
+    """Настройки проекта без метрик."""
+    templates = [dict(settings.TEMPLATES[0], BACKEND=(
+        'django.template.backends.django.DjangoTemplates'))]
+    caches = {'default': dict(settings.CACHES['default'], BACKEND=(
+        'django.core.cache.backends.locmem.LocMemCache'))}
+    middleware = [name for name in settings.MIDDLEWARE
+                  if name != 'yatube.middleware.MetricsMiddleware']
+    return {'TEMPLATES': templates, 'CACHES': caches,
+            'MIDDLEWARE': middleware}
+
+
+def timed_get(client, url):
+    started = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, url
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args(argv)
+    with test_database():
+        from django.conf import settings
+        from django.test import Client, override_settings
+        from django.urls import reverse
+
+        from posts.models import Post
+
+        seed(Dataset(users=50, posts=500, images=0))
+        post = Post.objects.select_related('author').first()
+        urls = {
+            'index': reverse('index'),
+            'post_view': reverse('post_view', args=[post.author.username,
+                                                    post.pk]),
+        }
+        plain = override_settings(**plain_settings(settings))
+        # Клиент собирает цепочку middleware при первом запросе, поэтому
+        # у замеров без метрик свой клиент
+        client, plain_client = Client(), Client()
+        results = {}
+        for name, url in urls.items():
+            timings = {'with': [], 'without': []}
+            # Чередуем серии: смена настроек сбрасывает кэш шаблонов
+            for _ in range(0, args.requests, BLOCK):
+                for _ in range(BLOCK):
+                    timings['with'].append(timed_get(client, url))
+                with plain:
+                    for _ in range(BLOCK):
+                        timings['without'].append(
+                            timed_get(plain_client, url))
+            with_us = statistics.median(timings['with']) * 1e6
+            without_us = statistics.median(timings['without']) * 1e6
+            results[name] = {
+                'with_metrics_us': round(with_us, 1),
+                'without_metrics_us': round(without_us, 1),
+                'overhead_us': round(with_us - without_us, 1),
+            }
+    worst = max(result['overhead_us'] for result in results.values())
+    print(json.dumps({'budget_us': BUDGET_US, 'results': results},
+                     indent=2))
+    if worst > BUDGET_US:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
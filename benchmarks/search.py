@@ -0,0 +1,98 @@
+"""Сравнение поиска через LIKE и через индекс FTS5.
+
+Запуск: python -m benchmarks.search [--posts 20000]
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.db import test_database
+
+WORDS = ('кот', 'собака', 'город', 'дорога', 'река', 'солнце', 'книга',
+         'утро', 'вечер', 'поезд', 'море', 'гора', 'лес', 'дождь', 'снег',
+         'окно', 'чай', 'письмо', 'музыка', 'друг')
+FORMS = ('', 'а', 'у', 'ом', 'ы', 'ами')
+SYLLABLES = ('ба', 'ве', 'го', 'ду', 'жи', 'зо', 'ка', 'ле', 'ми', 'но',
+             'пу', 'ра', 'си', 'то', 'фу', 'ха', 'це', 'ша', 'ще', 'ю')
+# Редкое слово, которое попадает в хвост словаря
+RARE = 'маяк'
+QUERIES = ('кот', 'котами', 'река дорога', 'письмо другу', 'снегом',
+           'маяками')
+REPEAT = 20
+
+
+def vocabulary(rng, size):
+    """Частые настоящие слова и длинный хвост редких выдуманных.
+
+    Частота слова обратно пропорциональна его номеру, как в живых текстах.
+    """
+    words = list(WORDS)
+    while len(words) < size:
+        words.append(''.join(rng.choice(SYLLABLES)
+                             for _ in range(rng.randint(2, 4))))
+    words.insert(size * 3 // 4, RARE)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+
+def text(rng, words, weights, length):
+    return ' '.join(word + rng.choice(FORMS)
+                    for word in rng.choices(words, weights, k=length))
+
+
+def seed(posts_count, comments_per_post):
+    from posts.models import Comment, Post, User
+
+    rng = random.Random(1)
+    words, weights = vocabulary(rng, 5000)
+    author = User.objects.create_user(username='benchmark')
+    Post.objects.bulk_create(
+        [Post(text=text(rng, words, weights, 40), author=author)
+         for _ in range(posts_count)], batch_size=500)
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    Comment.objects.bulk_create(
+        [Comment(text=text(rng, words, weights, 10), author=author,
+                 post_id=post_id)
+         for post_id in post_ids for _ in range(comments_per_post)],
+        batch_size=500)
+
+
+def measure(backend, query):
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        page = backend.search(query, limit=10)
+    return (time.perf_counter() - started) / REPEAT * 1000, page
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--comments', type=int, default=2)
+    args = parser.parse_args()
+    with test_database():
+        from posts.search import LikeSearchBackend, SqliteSearchBackend
+
+        seed(args.posts, args.comments)
+        fts = SqliteSearchBackend()
+        started = time.perf_counter()
+        indexed = fts.rebuild()
+        rebuild = time.perf_counter() - started
+        like = LikeSearchBackend()
+        results = {'posts': args.posts, 'indexed_texts': indexed,
+                   'rebuild_s': round(rebuild, 3), 'queries': {}}
+        for query in QUERIES:
+            like_ms, like_page = measure(like, query)
+            fts_ms, fts_page = measure(fts, query)
+            results['queries'][query] = {
+                'like_ms': round(like_ms, 3),
+                'fts_ms': round(fts_ms, 3),
+                'speedup': round(like_ms / fts_ms, 1),
+                'like_hits': len(like_page.post_ids),
+                'fts_hits': len(fts_page.post_ids),
+            }
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
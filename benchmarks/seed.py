@@ -0,0 +1,165 @@
+"""Синтетические данные для бенчмарков.
+
+Авторы выбираются со степенным распределением: немногие популярные авторы
+собирают большую часть подписок и записей, как в живых соцсетях. Данные
+вставляются через bulk_create, а счетчики, ленты, поисковый индекс и копии
+картинок собираются после вставки теми же функциями, что и в проекте.
+"""
+import os
+import random
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from io import BytesIO
+
+from PIL import Image
+
+PASSWORD = 'password'
+WORDS = ('кот', 'город', 'дорога', 'река', 'солнце', 'книга', 'утро',
+         'вечер', 'поезд', 'море', 'гора', 'лес', 'дождь', 'снег', 'окно',
+         'чай', 'письмо', 'музыка', 'друг', 'история')
+BATCH_SIZE = 500
+
+
+@dataclass
+class Dataset:
+    users: int = 1000
+    groups: int = 20
+    posts: int = 10000
+    comments_per_post: int = 3
+    follows_per_user: int = 20
+    images: int = 20
+    # Показатель степенного распределения популярности авторов
+    alpha: float = 1.0
+    seed: int = 1
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _weights(count, alpha):
+    return [1 / rank ** alpha for rank in range(1, count + 1)]
+
+
+def _text(rng, length):
+    return ' '.join(rng.choice(WORDS) for _ in range(length)).capitalize()
+
+
+def _chunks(items, size=BATCH_SIZE):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _bulk(model, objects):
+    for chunk in _chunks(objects):
+        model.objects.bulk_create(chunk)
+
+
+def _bulk_dated(model, field, objects):
+    """Как _bulk, но сохраняет даты auto_now_add из объектов.
+
+    bulk_create заменяет их текущим временем, поэтому даты записываются
+    после вставки через bulk_update. База пустая, и id строк идут в порядке
+    вставки.
+    """
+    dates = []
+
+    def remember():
+        for obj in objects:
+            dates.append(getattr(obj, field))
+            yield obj
+
+    _bulk(model, remember())
+    ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+    for chunk in _chunks(zip(ids, dates)):
+        model.objects.bulk_update(
+            [model(pk=pk, **{field: date}) for pk, date in chunk], [field])
+
+
+def _image(rng, directory, number):
+    color = tuple(rng.randrange(256) for _ in range(3))
+    image = Image.new('RGB', (1200, 800), color)
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG')
+    name = f'posts/benchmark_{number}.jpg'
+    with open(os.path.join(directory, name), 'wb') as file:
+        file.write(buffer.getvalue())
+    return name
+
+
+def seed(dataset):
+    """Заполняет пустую базу одной транзакцией, возвращает id объектов."""
+    from django.db import transaction
+
+    with transaction.atomic():
+        return _seed(dataset)
+
+
+def _seed(dataset):
+    # Django импортируется здесь: модуль читается до настройки Django
+    from django.conf import settings
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+
+    from posts import renditions, search, timeline
+    from posts.counters import recount
+    from posts.models import Comment, Follow, Group, Post, User
+
+    rng = random.Random(dataset.seed)
+    now = timezone.now()
+    password = make_password(PASSWORD)
+    _bulk(User, (User(username=f'user{number}', password=password)
+                 for number in range(dataset.users)))
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    popularity = _weights(len(user_ids), dataset.alpha)
+
+    _bulk(Group, (Group(title=f'Сообщество {number}', slug=f'group{number}')
+                  for number in range(dataset.groups)))
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+
+    def follows():
+        for user_id in user_ids:
+            count = min(dataset.follows_per_user, len(user_ids) - 1)
+            authors = set()
+            while len(authors) < count:
+                author_id = rng.choices(user_ids, popularity)[0]
+                if author_id != user_id:
+                    authors.add(author_id)
+            for author_id in authors:
+                yield Follow(user_id=user_id, author_id=author_id)
+
+    _bulk(Follow, follows())
+
+    _bulk_dated(Post, 'pub_date', (Post(
+        text=_text(rng, rng.randint(10, 60)),
+        author_id=rng.choices(user_ids, popularity)[0],
+        group_id=rng.choice(group_ids) if group_ids and rng.random() < .5
+        else None,
+        pub_date=now - timedelta(minutes=rng.randrange(525600)),
+    ) for _ in range(dataset.posts)))
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+    _bulk_dated(Comment, 'created', (Comment(
+        post_id=post_id, author_id=rng.choice(user_ids),
+        text=_text(rng, rng.randint(3, 20)),
+        created=now - timedelta(minutes=rng.randrange(525600)),
+    ) for post_id in post_ids
+        for _ in range(rng.randint(0, 2 * dataset.comments_per_post))))
+
+    if dataset.images:
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'posts'),
+                    exist_ok=True)
+        for number, post_id in enumerate(rng.sample(
+                post_ids, min(dataset.images, len(post_ids)))):
+            name = _image(rng, settings.MEDIA_ROOT, number)
+            Post.objects.filter(pk=post_id).update(image=name)
+            renditions.generate(post_id)
+
+    recount(batch_size=BATCH_SIZE)
+    timeline.rebuild(batch_size=BATCH_SIZE)
+    search.get_backend().rebuild(batch_size=BATCH_SIZE)
+    return {'users': user_ids, 'groups': group_ids, 'posts': post_ids}
@@ -0,0 +1,139 @@
+"""WSGI против ASGI при одинаковом числе потоков и одной нагрузке.
+
+Запуск: python -m benchmarks.servers [--clients 64] [--threads 8]
+[--client-delay-ms 20] [--seconds 5]
+
+--clients клиентов без пауз запрашивают ленту и страницы записей. Сервер
+в обоих режимах выполняет не больше --threads запросов одновременно:
+
+- wsgi — как многопоточный WSGI-сервер: поток занят запросом, пока ответ
+  не отдан клиенту;
+- asgi — yatube.handlers.ASGIHandler: поток занят только работой
+  Django, ответ отдается в цикле событий.
+
+--client-delay-ms — время отправки ответа медленному клиенту (сеть,
+мобильные). Именно его ASGI не тратит на потоки.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+from benchmarks.concurrency import Worker
+from benchmarks.db import test_database
+from benchmarks.feeds import percentile
+from benchmarks.seed import Dataset, seed
+
+
+def summarize(latencies, elapsed):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies_ms),
+        'throughput_rps': round(len(latencies_ms) / elapsed, 1),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+    }
+
+
+def run_wsgi(args, urls):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    slots = threading.BoundedSemaphore(args.threads)
+    delay = args.client_delay_ms / 1000
+
+    def request(rng):
+        environ = factory.get(rng.choice(urls)).environ
+        status = []
+        with slots:
+            response = handler(environ,
+                               lambda code, headers: status.append(code))
+            b''.join(response)
+            # Поток сервера ждет, пока ответ уйдет клиенту
+            time.sleep(delay)
+            response.close()
+        return status[0].startswith('200')
+
+    deadline = time.perf_counter() + args.seconds
+    clients = [Worker(request, deadline, i) for i in range(args.clients)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return summarize([latency for client in clients
+                      for latency in client.latencies],
+                     time.perf_counter() - started)
+
+
+def run_asgi(args, urls):
+    from yatube.handlers import ASGIHandler
+
+    application = ASGIHandler(threads=args.threads)
+    delay = args.client_delay_ms / 1000
+    latencies = []
+
+    async def client(seed, deadline):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            path, _, query = rng.choice(urls).partition('?')
+            scope = {'type': 'http', 'method': 'GET', 'path': path,
+                     'query_string': query.encode(),
+                     'headers': [(b'host', b'testserver')]}
+            statuses = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                else:
+                    await asyncio.sleep(delay)
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            if statuses[0] == 200:
+                latencies.append(time.perf_counter() - started)
+
+    async def main():
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(*(client(i, deadline)
+                               for i in range(args.clients)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    application.executor.shutdown(wait=True)
+    return summarize(latencies, elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--client-delay-ms', type=float, default=20)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args(argv)
+    with test_database():
+        from django.urls import reverse
+
+        from posts.models import Post
+
+        seed(Dataset(users=200, posts=2000, images=0))
+        urls = [reverse('index')] + [
+            reverse('post_view', args=[post.author.username, post.pk])
+            for post in Post.objects.select_related('author')[:200]]
+        results = {'wsgi': run_wsgi(args, urls),
+                   'asgi': run_asgi(args, urls)}
+    print(json.dumps({'clients': args.clients, 'threads': args.threads,
+                      'client_delay_ms': args.client_delay_ms,
+                      'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'priority', 'attempts',
+                    'available_at', 'created')
+    list_filter = ('status', 'name')
+    search_fields = ('=dedup_key',)
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        # Задачу с ключом, который уже ждет в очереди, повторять не нужно
+        queued = (Job.objects.filter(status=Job.QUEUED)
+                  .exclude(dedup_key=None).values('dedup_key'))
+        queryset.filter(status=Job.FAILED).exclude(
+            dedup_key__in=queued).update(
+            status=Job.QUEUED, attempts=0, available_at=timezone.now())
+    retry.short_description = 'Повторить невыполненные задачи'
+
+
+admin.site.register(Job, JobAdmin)
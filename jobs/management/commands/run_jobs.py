@@ -0,0 +1,27 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                            default=settings.JOBS_PROCESSES)
+        parser.add_argument('--once', action='store_true',
+                            help='Выйти, когда очередь опустеет')
+        parser.add_argument('--report-interval', type=float, default=10,
+                            help='Как часто печатать пропускную '
+                                 'способность, секунд')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['processes'], report=self.write_report)
+        worker.run(once=options['once'],
+                   report_interval=options['report_interval'])
+
+    def write_report(self, report):
+        self.stdout.write(json.dumps(report))
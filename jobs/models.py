@@ -0,0 +1,48 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField('Функция', max_length=200)
+    kwargs = models.TextField('Аргументы', default='{}')
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    status = models.CharField('Состояние', max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    dedup_key = models.CharField('Ключ повтора', max_length=200, blank=True,
+                                 null=True)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Попыток всего',
+                                                    default=5)
+    available_at = models.DateTimeField('Доступна с', default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default='',
+                             editable=False)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+    last_error = models.TextField('Последняя ошибка', blank=True,
+                                  default='')
+
+    class Meta:
+        verbose_name = 'задача'
+        verbose_name_plural = 'задачи'
+        indexes = [
+            models.Index(fields=('status', 'available_at'),
+                         name='job_status_available_idx'),
+        ]
+        constraints = [
+            # Одна ждущая задача на ключ; выполняемая не мешает поставить
+            # новую, ведь данные могли измениться после ее начала
+            models.UniqueConstraint(
+                fields=('dedup_key',), condition=models.Q(status='queued'),
+                name='unique_queued_dedup_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
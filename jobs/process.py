@@ -0,0 +1,30 @@
+"""Код дочерних процессов обработчика.
+
+Модуль импортируется в процессе, запущенном через spawn, до настройки
+Django, поэтому модели и очередь импортируются только внутри функций.
+"""
+import time
+import traceback
+
+import django
+
+
+def setup():
+    django.setup()
+
+
+def execute(name, kwargs):
+    """Выполняет задачу: (текст ошибки или None, время выполнения)."""
+    from django.db import close_old_connections
+
+    from .queue import run
+
+    started = time.perf_counter()
+    close_old_connections()
+    try:
+        run(name, kwargs)
+    except Exception:
+        return traceback.format_exc(), time.perf_counter() - started
+    finally:
+        close_old_connections()
+    return None, time.perf_counter() - started
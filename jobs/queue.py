@@ -0,0 +1,95 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача — путь к функции и ее именованные аргументы в JSON. Она ставится
+в той же транзакции, что и изменение данных, поэтому не теряется при
+откате и не запускается раньше фиксации.
+
+Обработчик (manage.py run_jobs) забирает задачи пачками: SELECT ... LIMIT
+и UPDATE с меткой claim в одной транзакции. Забранная задача невидима
+другим обработчикам JOBS_VISIBILITY_TIMEOUT секунд; если обработчик
+упал, после этого срока задачу заберет другой. Ошибка возвращает задачу
+в очередь с растущей задержкой, после max_attempts попыток задача
+помечается невыполненной и остается в таблице для разбора.
+"""
+import json
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+def enqueue(name, priority=0, dedup_key=None, delay=0, max_attempts=None,
+            **kwargs):
+    """Ставит вызов функции name(**kwargs) в очередь.
+
+    Если в очереди уже ждет задача с тем же dedup_key, новая не ставится.
+    """
+    job = Job(name=name, kwargs=json.dumps(kwargs), priority=priority,
+              dedup_key=dedup_key,
+              max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+              available_at=timezone.now() + timedelta(seconds=delay))
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+
+
+def _expire(now):
+    """Помечает невыполненными задачи, обработчик которых пропал."""
+    return (Job.objects
+            .filter(status=Job.RUNNING, available_at__lte=now,
+                    attempts__gte=F('max_attempts'))
+            .update(status=Job.FAILED, claim='',
+                    last_error='Истек срок выполнения'))
+
+
+def claim(limit, visibility_timeout=None):
+    """Забирает до limit задач по приоритету и времени постановки."""
+    timeout = visibility_timeout or settings.JOBS_VISIBILITY_TIMEOUT
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        _expire(now)
+        claimable = Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING),
+                                       available_at__lte=now)
+        ids = claimable.order_by('-priority', 'available_at', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            ids = ids.select_for_update(skip_locked=True)
+        ids = list(ids.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        claimable.filter(pk__in=ids).update(
+            status=Job.RUNNING, claim=token, attempts=F('attempts') + 1,
+            available_at=now + timedelta(seconds=timeout))
+    return list(Job.objects.filter(claim=token).order_by('-priority', 'pk'))
+
+
+def run(name, kwargs):
+    import_string(name)(**json.loads(kwargs))
+
+
+def complete(*jobs):
+    """Удаляет выполненные задачи, если их не забрал другой обработчик."""
+    Job.objects.filter(pk__in=[job.pk for job in jobs],
+                       claim__in={job.claim for job in jobs}).delete()
+
+
+def fail(job, error):
+    """Возвращает задачу в очередь или помечает невыполненной."""
+    jobs = Job.objects.filter(pk=job.pk, claim=job.claim)
+    if job.attempts >= job.max_attempts:
+        jobs.update(status=Job.FAILED, claim='', last_error=error)
+        return False
+    delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+    try:
+        with transaction.atomic():
+            jobs.update(status=Job.QUEUED, claim='', last_error=error,
+                        available_at=timezone.now() + timedelta(
+                            seconds=delay))
+    except IntegrityError:
+        # Пока задача выполнялась, поставили такую же: она и выполнится
+        jobs.delete()
+    return True
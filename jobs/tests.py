@@ -0,0 +1,101 @@
+import os
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import queue
+from .models import Job
+from .process import execute
+from .worker import Worker
+
+calls = []
+
+
+def record(value):
+    calls.append(value)
+
+
+def explode():
+    raise ValueError('Ошибка задачи')
+
+
+def die():
+    os._exit(1)
+
+
+class TestQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_dedup_key(self):
+        queue.enqueue('jobs.tests.record', dedup_key='key', value=1)
+        queue.enqueue('jobs.tests.record', dedup_key='key', value=2)
+        self.assertEqual(Job.objects.count(), 1,
+                         msg='Задача с тем же ключом поставлена дважды')
+        queue.claim(10)
+        queue.enqueue('jobs.tests.record', dedup_key='key', value=3)
+        self.assertEqual(Job.objects.count(), 2,
+                         msg='Выполняемая задача мешает поставить новую')
+
+    def test_claim_by_priority(self):
+        queue.enqueue('jobs.tests.record', value='low')
+        queue.enqueue('jobs.tests.record', priority=5, value='high')
+        queue.enqueue('jobs.tests.record', delay=60, value='later')
+        first = queue.claim(1)
+        self.assertEqual([job.kwargs for job in first], ['{"value": "high"}'])
+        self.assertEqual(first[0].attempts, 1)
+        second = queue.claim(10)
+        self.assertEqual([job.kwargs for job in second], ['{"value": "low"}'],
+                         msg='Забранная или отложенная задача выдана снова')
+
+    def test_visibility_timeout(self):
+        queue.enqueue('jobs.tests.record', value=1)
+        job, = queue.claim(1)
+        self.assertEqual(queue.claim(1), [])
+        Job.objects.update(available_at=timezone.now() - timedelta(1))
+        reclaimed, = queue.claim(1)
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+        queue.complete(job)
+        self.assertTrue(Job.objects.filter(pk=job.pk).exists(),
+                        msg='Старый обработчик завершил чужую задачу')
+        queue.complete(reclaimed)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_RETRY_DELAY=0)
+    def test_retries(self):
+        queue.enqueue('jobs.tests.explode', max_attempts=2)
+        worker = Worker(1)
+        job, = queue.claim(1)
+        worker.finish([(job, *execute(job.name, job.kwargs))])
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('Ошибка задачи', job.last_error)
+        job, = queue.claim(1)
+        worker.finish([(job, *execute(job.name, job.kwargs))])
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        self.assertEqual(queue.claim(1), [])
+        self.assertEqual((worker.stats.retried, worker.stats.failed), (1, 1))
+
+    def test_run(self):
+        queue.enqueue('jobs.tests.record', value=1)
+        job, = queue.claim(1)
+        worker = Worker(1)
+        worker.finish([(job, *execute(job.name, job.kwargs))])
+        self.assertEqual(calls, [1])
+        self.assertFalse(Job.objects.exists())
+        report = worker.stats.report()
+        self.assertEqual((report['done'], report['queued']), (1, 0))
+
+    @override_settings(JOBS_RETRY_DELAY=0)
+    def test_crashed_child(self):
+        queue.enqueue('jobs.tests.die', priority=1, max_attempts=1)
+        queue.enqueue('jobs.tests.record', value=1)
+        stats = Worker(1).run(once=True, idle_sleep=0.1)
+        self.assertEqual(Job.objects.get().status, Job.FAILED,
+                         msg='Задача, убившая процесс, не помечена')
+        self.assertIn('Пул процессов сломан', Job.objects.get().last_error)
+        self.assertEqual((stats.done, stats.retried, stats.failed),
+                         (1, 1, 1),
+                         msg='Пул не пересоздан после падения процесса')
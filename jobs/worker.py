@@ -0,0 +1,130 @@
+"""Обработчик очереди: задачи выполняются в пуле процессов.
+
+Главный процесс забирает задачи и записывает результаты, дочерние только
+вызывают функции (jobs.process). Дочерние процессы запускаются через
+spawn, а не fork: открытые соединения с базой и потоки главного процесса
+им не достаются.
+"""
+import multiprocessing
+import time
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                wait)
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from . import process, queue
+from .models import Job
+
+
+@dataclass
+class Stats:
+    done: int = 0
+    retried: int = 0
+    failed: int = 0
+    busy: float = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def record(self, error, duration, retried=False):
+        self.busy += duration
+        if error is None:
+            self.done += 1
+        elif retried:
+            self.retried += 1
+        else:
+            self.failed += 1
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        finished = self.done + self.retried + self.failed
+        return {
+            'done': self.done,
+            'retried': self.retried,
+            'failed': self.failed,
+            'jobs_per_s': round(finished / elapsed, 1) if elapsed else 0,
+            'mean_ms': round(self.busy / finished * 1000, 1)
+            if finished else 0,
+            'queued': Job.objects.filter(status=Job.QUEUED).count(),
+        }
+
+
+class Worker:
+    def __init__(self, processes, prefetch=4, report=None):
+        self.processes = processes
+        self.limit = processes * prefetch
+        self.report = report
+        self.stats = Stats()
+
+    def pool(self):
+        return ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=process.setup)
+
+    def submit(self, pool, job):
+        try:
+            return pool.submit(process.execute, job.name, job.kwargs)
+        except BrokenProcessPool as error:
+            # Пул сломался после последнего wait: задача уйдет в crashed
+            # вместе с остальными
+            future = Future()
+            future.set_exception(error)
+            return future
+
+    def run(self, once=False, idle_sleep=1.0, report_interval=10.0):
+        """Выполняет задачи; с once — пока очередь не опустеет."""
+        running = {}
+        reported = time.perf_counter()
+        pool = self.pool()
+        try:
+            while True:
+                # Новые задачи забираются пачкой, когда половина
+                # забранных выполнена
+                if len(running) <= self.limit // 2:
+                    for job in queue.claim(self.limit - len(running)):
+                        running[self.submit(pool, job)] = job
+                if not running:
+                    if once:
+                        break
+                    time.sleep(idle_sleep)
+                    continue
+                done, _ = wait(running, timeout=idle_sleep,
+                               return_when=FIRST_COMPLETED)
+                errors = [future.exception() for future in done
+                          if future.exception() is not None]
+                self.finish([(running.pop(future), *future.result())
+                             for future in done
+                             if future.exception() is None])
+                if errors:
+                    # Дочерний процесс погиб (OOM, падение в PIL): пул
+                    # больше не принимает задач, а все незавершенные
+                    # получат ту же ошибку
+                    self.crashed(running.values(), errors[0])
+                    running.clear()
+                    pool.shutdown(wait=False)
+                    pool = self.pool()
+                if (self.report
+                        and time.perf_counter() - reported >= report_interval):
+                    self.report(self.stats.report())
+                    reported = time.perf_counter()
+        finally:
+            pool.shutdown()
+        if self.report:
+            self.report(self.stats.report())
+        return self.stats
+
+    def finish(self, results):
+        """Записывает результаты: список (задача, ошибка, время)."""
+        completed = []
+        for job, error, duration in results:
+            if error is None:
+                completed.append(job)
+                self.stats.record(None, duration)
+            else:
+                self.stats.record(error, duration, queue.fail(job, error))
+        if completed:
+            queue.complete(*completed)
+
+    def crashed(self, jobs, error):
+        """Возвращает в очередь задачи сломанного пула процессов."""
+        error = f'Пул процессов сломан: {error!r}'
+        for job in jobs:
+            self.stats.record(error, 0, queue.fail(job, error))
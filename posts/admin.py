@@ -1,13 +1,33 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Follow, Group, Post
+from .pagination import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class FastChangeListMixin:
+    """Списки без COUNT(*) по всей таблице на каждой странице."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class PostAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
+    # Сколько найденных записей показывать при поиске по индексу
+    search_limit = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        post_ids = search.get_backend().search(
+            search_term, limit=self.search_limit).post_ids
+        return queryset.filter(pk__in=post_ids), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -17,17 +37,21 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('post', 'author', 'text',)
+    list_select_related = ('post__author', 'author')
+    autocomplete_fields = ('post', 'author')
     search_fields = ('text',)
     list_filter = ('created',)
+    date_hierarchy = 'created'
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(FastChangeListMixin, admin.ModelAdmin):
     list_display = ('user', 'author',)
-    search_fields = ('author',)
-    list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('=user__username', '=author__username')
     empty_value_display = '-пусто-'
 
 
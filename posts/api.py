@@ -0,0 +1,128 @@
+"""JSON API лент и записи только для чтения.
+
+Строки берутся через values() одним запросом, без создания объектов
+моделей. Страницы листаются курсорами ``?after=``/``?before=`` как в
+HTML-лентах. Ответы несут ETag и Last-Modified по версиям лент (см.
+posts.conditional), и неизменившаяся лента отдает 304 без запросов за
+записями.
+"""
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from . import feeds, versions
+from .conditional import Validators
+from .models import Comment, Group, Post, User
+from .pagination import CursorPaginator
+
+POST_FIELDS = ('id', 'text', 'pub_date', 'author__username', 'group__slug',
+               'image', 'image_renditions', 'comment_count')
+COMMENT_FIELDS = ('id', 'author__username', 'text', 'created')
+
+
+def _renditions(raw):
+    if not raw:
+        return {}
+    return {name: {key: rendition[key]
+                   for key in ('url', 'width', 'height', 'srcset')}
+            for name, rendition in json.loads(raw).items()}
+
+
+def serialize_post(row):
+    username = row['author__username']
+    return {
+        'id': row['id'],
+        'url': reverse('post_view', args=[username, row['id']]),
+        'text': row['text'],
+        'pub_date': row['pub_date'].isoformat(),
+        'author': username,
+        'group': row['group__slug'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+        'renditions': _renditions(row['image_renditions']),
+        'comment_count': row['comment_count'],
+    }
+
+
+def serialize_comment(row):
+    return {'id': row['id'], 'author': row['author__username'],
+            'text': row['text'], 'created': row['created'].isoformat()}
+
+
+def _page(request, queryset, serialize, per_page, **kwargs):
+    paginator = CursorPaginator(queryset, per_page, **kwargs)
+    page = paginator.get_page(after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+    return {'results': [serialize(row) for row in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor}
+
+
+def _respond(request, scopes, build, private=False):
+    validators = Validators(request, scopes, private=private)
+    response = validators.not_modified(request)
+    if response is None:
+        response = JsonResponse(build(),
+                                json_dumps_params={'ensure_ascii': False})
+    validators.apply(response)
+    if private:
+        response['Cache-Control'] = 'private, no-cache'
+    else:
+        response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+def _feed(request, queryset, scopes, private=False):
+    rows = queryset.values(*POST_FIELDS)
+    return _respond(request, scopes, lambda: _page(
+        request, rows, serialize_post, settings.POSTS_PER_PAGE),
+        private=private)
+
+
+def index(request):
+    return _feed(request, Post.objects.all(), [('index',)])
+
+
+def group_posts(request, slug):
+    group_id = get_object_or_404(Group.objects.values_list('pk', flat=True),
+                                 slug=slug)
+    return _feed(request, Post.objects.filter(group_id=group_id),
+                 [('group', group_id)])
+
+
+def profile(request, username):
+    author_id = get_object_or_404(User.objects.values_list('pk', flat=True),
+                                  username=username)
+    return _feed(request, Post.objects.filter(author_id=author_id),
+                 [('author', author_id)])
+
+
+def follow_index(request):
+    user = request.user
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Нужно войти'}, status=401)
+    return _feed(request, feeds.follow_feed(user),
+                 versions.follow_scopes(user), private=True)
+
+
+def post_view(request, post_id):
+    ids = (Post.objects.filter(pk=post_id)
+           .values_list('author_id', 'group_id').first())
+    if ids is None:
+        raise Http404
+    scopes = [*versions.post_scopes(*ids), ('comments', post_id)]
+
+    def build():
+        row = Post.objects.filter(pk=post_id).values(*POST_FIELDS).get()
+        comments = (Comment.objects.filter(post_id=post_id)
+                    .values(*COMMENT_FIELDS))
+        return {'post': serialize_post(row),
+                'comments': _page(request, comments, serialize_comment,
+                                  settings.COMMENTS_PER_PAGE,
+                                  field='created', descending=(
+                                      settings.COMMENTS_ORDER == 'newest'))}
+
+    return _respond(request, scopes, build)
@@ -0,0 +1,114 @@
+"""Условные ответы (ETag, Last-Modified) по версиям лент.
+
+Версия ленты — время последнего изменения записей или комментариев в ней
+(см. versions), поэтому валидаторы считаются без запросов к базе и до
+отрисовки страницы. Если версия вытеснена из кэша, она заменяется текущим
+временем: клиент получит страницу заново, но устаревшую — никогда.
+
+Last-Modified точен до секунды, а версии — до микросекунды. Пока не
+закончилась секунда последнего изменения, в нее может попасть еще одно
+с тем же Last-Modified, поэтому до ее конца валидатор — только ETag, а
+If-Modified-Since не проверяется.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from . import versions
+from .models import Group, Post, User
+
+
+class Validators:
+    def __init__(self, request, scopes, private=False):
+        values = versions.get_versions(versions.ALL, *scopes)
+        seconds = max(values) // 1_000_000
+        self.timestamp = (seconds if seconds < versions.now() // 1_000_000
+                          else None)
+        parts = [request.get_full_path(), *map(str, values)]
+        if private:
+            parts.append(str(request.user.pk))
+        self.etag = quote_etag(
+            hashlib.md5(':'.join(parts).encode()).hexdigest())
+
+    def not_modified(self, request):
+        """Ответ 304 (или 412), если у клиента актуальная версия."""
+        return get_conditional_response(request, etag=self.etag,
+                                        last_modified=self.timestamp)
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.timestamp is not None:
+            response['Last-Modified'] = http_date(self.timestamp)
+        return response
+
+
+def conditional_page(get_scopes):
+    """Условные ответы HTML-страницы для анонимных посетителей.
+
+    get_scopes получает аргументы представления и возвращает версии,
+    от которых зависит страница, или None, если объекта нет. Анонимным
+    посетителям страница отдается с ETag и Last-Modified и может
+    храниться в общих кэшах POSTS_HTTP_SHARED_MAX_AGE секунд.
+    Страницы вошедших пользователей личные и не кэшируются прокси.
+    Ответ в обоих случаях зависит от Cookie.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+            else:
+                response = _anonymous_response(request, view, get_scopes,
+                                               args, kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def _anonymous_response(request, view, get_scopes, args, kwargs):
+    scopes = get_scopes(*args, **kwargs)
+    if scopes is None:
+        return view(request, *args, **kwargs)
+    validators = Validators(request, scopes)
+    response = validators.not_modified(request)
+    if response is None:
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    validators.apply(response)
+    patch_cache_control(response, public=True, max_age=0,
+                        s_maxage=settings.POSTS_HTTP_SHARED_MAX_AGE)
+    return response
+
+
+def index_scopes():
+    return [('index',)]
+
+
+def group_scopes(slug):
+    group_id = (Group.objects.filter(slug=slug)
+                .values_list('pk', flat=True).first())
+    return None if group_id is None else [('group', group_id)]
+
+
+def profile_scopes(username):
+    author_id = (User.objects.filter(username=username)
+                 .values_list('pk', flat=True).first())
+    if author_id is None:
+        return None
+    return [('author', author_id), ('stats', author_id)]
+
+
+def post_scopes(username, post_id):
+    ids = (Post.objects.filter(author__username=username, pk=post_id)
+           .values_list('author_id', 'group_id').first())
+    if ids is None:
+        return None
+    return [*versions.post_scopes(*ids), ('comments', post_id),
+            ('stats', ids[0])]
@@ -0,0 +1,114 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from jobs.queue import enqueue
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def repair_later(name, pk):
+    """Ставит пересчет счетчиков одной строки в очередь, если его там нет."""
+    enqueue(f'posts.counters.{name}', priority=-10,
+            dedup_key=f'{name}:{pk}', pk=pk)
+
+
+def bump_stats(user_id, field, delta):
+    """Атомарно меняет счетчик пользователя, не уходя ниже нуля.
+
+    Если менять нечего, а строка счетчиков есть (счетчик разошелся
+    с данными), пересчет пользователя ставится в очередь. Строки нет,
+    когда пользователь удаляется каскадом: пересчитывать нечего.
+    """
+    stats = UserStats.objects.filter(user_id=user_id)
+    changed = stats
+    if delta < 0:
+        changed = stats.filter(**{f'{field}__gte': -delta})
+    if not changed.update(**{field: F(field) + delta}) and stats.exists():
+        repair_later('recount_user', user_id)
+
+
+def bump_comments(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    changed = posts
+    if delta < 0:
+        changed = posts.filter(comment_count__gte=-delta)
+    if (not changed.update(comment_count=F('comment_count') + delta)
+            and posts.exists()):
+        repair_later('recount_post', post_id)
+
+
+def stats_for(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(user=user)
+        return stats
+
+
+def _count(queryset, field):
+    counts = (queryset
+              .filter(**{field: OuterRef('pk')})
+              .order_by()
+              .values(field)
+              .annotate(count=Count('pk'))
+              .values('count'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _repair(model, field, actual, batch_size, dry_run):
+    drifted = (model.objects
+               .annotate(actual=actual)
+               .exclude(**{field: F('actual')})
+               .values_list('pk', flat=True))
+    if dry_run:
+        return drifted.count()
+    repaired = 0
+    while True:
+        batch = list(drifted[:batch_size])
+        if not batch:
+            return repaired
+        model.objects.filter(pk__in=batch).update(**{field: actual})
+        repaired += len(batch)
+
+
+def recount_user(pk):
+    """Пересчитывает счетчики одного пользователя."""
+    UserStats.objects.filter(pk=pk).update(
+        posts_count=_count(Post.objects, 'author'),
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'))
+
+
+def recount_post(pk):
+    """Пересчитывает число комментариев одной записи."""
+    Post.objects.filter(pk=pk).update(
+        comment_count=_count(Comment.objects, 'post'))
+
+
+def recount(batch_size=1000, dry_run=False):
+    """Пересчитывает все счетчики и возвращает число исправленных строк."""
+    if not dry_run:
+        missing = (User.objects
+                   .filter(stats__isnull=True)
+                   .values_list('pk', flat=True))
+        while True:
+            batch = list(missing[:batch_size])
+            if not batch:
+                break
+            UserStats.objects.bulk_create(
+                [UserStats(user_id=pk) for pk in batch],
+                ignore_conflicts=True)
+    return {
+        'comment_count': _repair(
+            Post, 'comment_count', _count(Comment.objects, 'post'),
+            batch_size, dry_run),
+        'posts_count': _repair(
+            UserStats, 'posts_count', _count(Post.objects, 'author'),
+            batch_size, dry_run),
+        'followers_count': _repair(
+            UserStats, 'followers_count', _count(Follow.objects, 'author'),
+            batch_size, dry_run),
+        'following_count': _repair(
+            UserStats, 'following_count', _count(Follow.objects, 'user'),
+            batch_size, dry_run),
+    }
@@ -0,0 +1,40 @@
+from .models import Post
+from .pagination import MergedFeed
+from .timeline import timeline_filter, timeline_sources
+
+
+def feed_posts():
+    """Записи с автором и сообществом одним запросом.
+
+    Шаблон post_item.html читает только эти поля и счетчик
+    comment_count и не делает дополнительных запросов на каждую запись.
+    """
+    return Post.objects.select_related('author', 'group')
+
+
+def index_feed():
+    return feed_posts()
+
+
+def group_feed(group):
+    return feed_posts().filter(group=group)
+
+
+def profile_feed(author):
+    return feed_posts().filter(author=author)
+
+
+def follow_feed(user):
+    return MergedFeed(feed_posts(), timeline_filter(user),
+                      lambda: timeline_sources(user))
+
+
+def comment_thread(post):
+    """Комментарии записи с авторами; порядок задает пагинатор."""
+    return post.comments.select_related('author')
+
+
+def search_feed(post_ids):
+    """Записи с переданными id в порядке списка (по релевантности)."""
+    posts = feed_posts().in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
@@ -0,0 +1,36 @@
+"""Авторы, на которых подписан пользователь, в кэше.
+
+Множество id нужно ключу ленты подписок и кнопке подписки в профиле,
+поэтому читается из кэша, а не отдельным запросом в каждом из этих мест.
+Сигналы Follow удаляют его при каждой подписке и отписке; срок нужен
+только для массовых операций в обход сигналов. Без общего кэша
+(yatube.caches.is_shared) множество читается из базы. Запись подписки на него
+не опирается: устаревшее множество не должно терять подписку.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from yatube.caches import is_shared
+
+
+def _key(user_id):
+    return f'following:{user_id}'
+
+
+def _load(user):
+    return frozenset(user.follower.values_list('author_id', flat=True))
+
+
+def following_ids(user):
+    if not is_shared():
+        return _load(user)
+    key = _key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _load(user)
+        cache.set(key, ids, settings.USER_CACHE_TIMEOUT)
+    return ids
+
+
+def forget(user_id):
+    cache.delete(_key(user_id))
@@ -1,5 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from .images import normalize_upload
 from .models import Comment, Post
 
 
@@ -13,6 +15,12 @@ class PostForm(ModelForm):
                      'Если, конечно, хотите.'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return normalize_upload(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
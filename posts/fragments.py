@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from yatube.caches import versioned_timeout
+
+from . import versions
+
+
+def fragment_key(post, version=None):
+    """Ключ карточки; version — версия ALL (см. posts.versions)."""
+    if version is None:
+        version, = versions.get_versions(versions.ALL)
+    return (f'post-fragment:{version}:{post.pk}:{post.updated.timestamp()}:'
+            f'{post.group_id}:{post.comment_count}')
+
+
+def render_fragment(post):
+    """Части карточки записи, одинаковые для всех читателей."""
+    context = {'post': post, 'image_sizes': settings.POST_IMAGE_SIZES}
+    return {
+        'body': render_to_string('post_body.html', context),
+        'comments': render_to_string('post_comments_link.html', context),
+    }
+
+
+def attach_fragments(posts):
+    """Добавляет записям отрисованные фрагменты, читая кэш одним запросом.
+
+    Ключ содержит дату изменения записи, сообщество и число комментариев,
+    поэтому редактирование, смена картинки и новый комментарий дают новый
+    ключ. Сообщество записи сбрасывается при удалении сообщества в обход
+    Post.updated, а переименование сообщества или автора меняет версию
+    ALL, которая тоже входит в ключ.
+    """
+    posts = list(posts)
+    version, = versions.get_versions(versions.ALL)
+    keys = {fragment_key(post, version): post for post in posts}
+    fragments = cache.get_many(keys)
+    missing = {}
+    for key, post in keys.items():
+        if key not in fragments:
+            missing[key] = fragments[key] = render_fragment(post)
+        post.fragment = fragments[key]
+    if missing:
+        cache.set_many(missing,
+                       versioned_timeout(settings.POST_FRAGMENT_TIMEOUT))
+    return posts
@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+
+def check_upload(uploaded):
+    """Проверяет размер файла и картинки по заголовку, не декодируя ее."""
+    if uploaded.size > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(
+                settings.POST_IMAGE_MAX_UPLOAD_SIZE)})
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)s×%(height)s слишком большая.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height})
+
+
+def normalize_upload(uploaded):
+    """Уменьшает картинку до POST_IMAGE_MAX_SIZE и пересохраняет без EXIF.
+
+    Для JPEG уменьшение начинается еще при декодировании (draft), поэтому
+    в память не попадает картинка в исходном разрешении.
+    """
+    check_upload(uploaded)
+    max_size = settings.POST_IMAGE_MAX_SIZE
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        if image.format == 'JPEG':
+            image.draft('RGB', max_size)
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(max_size, Image.LANCZOS)
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        fmt, extension, options = 'PNG', 'png', {'optimize': True}
+        image = image.convert('RGBA')
+    else:
+        fmt, extension, options = 'JPEG', 'jpg', {
+            'quality': settings.POST_IMAGE_QUALITY, 'optimize': True}
+        image = image.convert('RGB')
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+
+    name = os.path.splitext(os.path.basename(uploaded.name))[0]
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(output, fmt, **options)
+    output.seek(0)
+    return File(output, name=f'{name}.{extension}')
@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import MODELS, WRITERS, Checkpoint, export_data
+
+
+class Command(BaseCommand):
+    help = ('Выгружает сообщества, записи, комментарии и подписки '
+            'в JSON Lines или CSV')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help='Файл для jsonl или каталог для csv')
+        parser.add_argument('--format', choices=WRITERS, default='jsonl')
+        parser.add_argument('--models', nargs='+', choices=MODELS,
+                            default=MODELS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить с контрольной точки')
+        parser.add_argument('--checkpoint',
+                            help='Файл контрольной точки, по умолчанию '
+                                 '<path>.checkpoint')
+
+    def handle(self, *args, **options):
+        path = options['path'].rstrip(os.sep)
+        checkpoint = Checkpoint(options['checkpoint']
+                                or f'{path}.checkpoint',
+                                resume=options['resume'])
+        exported = export_data(path, fmt=options['format'],
+                               models=options['models'],
+                               batch_size=options['batch_size'],
+                               checkpoint=checkpoint,
+                               progress=self.progress)
+        for model, count in exported.items():
+            self.stdout.write(f'{model}: {count}')
+
+    def progress(self, model, count):
+        self.stderr.write(f'{model}: выгружено {count}')
@@ -0,0 +1,44 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts.models import Post
+from posts.renditions import generate
+
+
+class Command(BaseCommand):
+    help = 'Готовит копии картинок для записей, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать копии для всех картинок')
+        parser.add_argument('--processes', type=int, default=0,
+                            help='Готовить копии в пуле из N процессов')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            posts = posts.filter(image_renditions='')
+        post_ids = posts.order_by('pk').values_list('pk', flat=True)
+        processes = options['processes']
+        if processes:
+            with ProcessPoolExecutor(processes) as pool, \
+                    ThreadPoolExecutor(processes) as threads:
+                def run(post_id):
+                    try:
+                        generate(post_id, pool=pool)
+                    finally:
+                        close_old_connections()
+
+                self.report(threads.map(run, list(post_ids)))
+        else:
+            self.report(generate(post_id) for post_id in post_ids.iterator())
+
+    def report(self, results):
+        done = 0
+        for _ in results:
+            done += 1
+            if done % 100 == 0:
+                self.stdout.write(f'Обработано: {done}')
+        self.stdout.write(f'Готово, записей: {done}')
@@ -0,0 +1,52 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import READERS, Checkpoint, import_data, rebuild
+
+
+class Command(BaseCommand):
+    help = ('Загружает сообщества, записи, комментарии и подписки '
+            'из JSON Lines или CSV')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help='Файл jsonl или каталог с файлами csv')
+        parser.add_argument('--format', choices=READERS,
+                            help='По умолчанию csv для каталога, '
+                                 'иначе jsonl')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resume', action='store_true',
+                            help='Продолжить с контрольной точки')
+        parser.add_argument('--checkpoint',
+                            help='Файл контрольной точки, по умолчанию '
+                                 '<path>.checkpoint')
+        parser.add_argument('--no-create-users', action='store_false',
+                            dest='create_users',
+                            help='Пропускать строки с неизвестными '
+                                 'пользователями вместо их создания')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Не пересобирать счетчики, ленты и '
+                                 'поисковый индекс')
+
+    def handle(self, *args, **options):
+        path = options['path'].rstrip(os.sep)
+        fmt = options['format'] or ('csv' if os.path.isdir(path)
+                                    else 'jsonl')
+        checkpoint = Checkpoint(options['checkpoint']
+                                or f'{path}.checkpoint',
+                                resume=options['resume'])
+        imported = import_data(path, fmt=fmt,
+                               batch_size=options['batch_size'],
+                               checkpoint=checkpoint,
+                               create_users=options['create_users'],
+                               progress=self.progress,
+                               skip_rebuild=True)
+        for model, count in imported.items():
+            self.stdout.write(f'{model}: {count}')
+        if options['skip_rebuild']:
+            return
+        rebuild(batch_size=options['batch_size'], log=self.stderr.write)
+
+    def progress(self, model, count):
+        self.stderr.write(f'{model}: загружено {count}')
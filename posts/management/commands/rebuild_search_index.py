@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает поисковый индекс записей и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = get_backend().rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f'Проиндексировано текстов: {indexed}')
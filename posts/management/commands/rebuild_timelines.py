@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Заново собирает ленты подписок из подписок и записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, dest='user_id',
+                            help='id пользователя, ленту которого собрать')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.TIMELINE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        follows = rebuild(user_id=options['user_id'],
+                          batch_size=options['batch_size'])
+        self.stdout.write(f'Подписок обработано: {follows}')
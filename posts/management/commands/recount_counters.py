@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики комментариев, записей и подписок '
+            'и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать число расхождений')
+
+    def handle(self, *args, **options):
+        drift = recount(batch_size=options['batch_size'],
+                        dry_run=options['dry_run'])
+        for field, count in drift.items():
+            self.stdout.write(f'{field}: {count}')
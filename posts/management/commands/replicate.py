@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from yatube.routers import replicate
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплику для чтения лент. '
+            'Замена настоящей репликации при локальной работе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Повторять каждые N секунд')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+        replica = settings.DATABASES[settings.REPLICA_DATABASE]['NAME']
+        while True:
+            started = time.perf_counter()
+            replicate(primary, replica)
+            self.stdout.write(
+                f'Реплика обновлена за '
+                f'{time.perf_counter() - started:.2f} с')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def dedup_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = (Follow.objects
+                  .values('user_id', 'author_id')
+                  .annotate(first=Min('pk'), count=Count('pk'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        extra = duplicate['count'] - 1
+        (Follow.objects
+         .filter(user_id=duplicate['user_id'],
+                 author_id=duplicate['author_id'])
+         .exclude(pk=duplicate['first'])
+         .delete())
+        UserStats.objects.filter(user_id=duplicate['user_id']).update(
+            following_count=F('following_count') - extra)
+        UserStats.objects.filter(user_id=duplicate['author_id']).update(
+            followers_count=F('followers_count') - extra)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_post_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedup_follows, migrations.RunPython.noop),
+    ]
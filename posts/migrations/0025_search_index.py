@@ -0,0 +1,50 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def insert(cursor, rows):
+    cursor.executemany(
+        'INSERT INTO posts_search (content, kind, object_id, post_id) '
+        'VALUES (%s, %s, %s, %s)', rows)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5('
+        'content, kind UNINDEXED, object_id UNINDEXED, post_id UNINDEXED)')
+    from posts.search import normalize
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    sources = (
+        ('post', Post.objects.values_list('pk', 'text', 'pk')),
+        ('comment', Comment.objects.values_list('pk', 'text', 'post_id')),
+    )
+    with schema_editor.connection.cursor() as cursor:
+        for kind, rows in sources:
+            batch = []
+            for pk, text, post_id in rows.order_by('pk').iterator(
+                    chunk_size=BATCH_SIZE):
+                batch.append((normalize(text), kind, pk, post_id))
+                if len(batch) >= BATCH_SIZE:
+                    insert(cursor, batch)
+                    batch = []
+            insert(cursor, batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
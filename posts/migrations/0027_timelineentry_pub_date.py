@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-18 20:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+
+
+def fill_pub_dates(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    pub_date = Subquery(Post.objects.filter(pk=OuterRef('post_id'))
+                        .values('pub_date'))
+    last = 0
+    while True:
+        batch = list(TimelineEntry.objects.filter(pk__gt=last)
+                     .order_by('pk')
+                     .values_list('pk', flat=True)[:BATCH_SIZE])
+        if not batch:
+            return
+        TimelineEntry.objects.filter(pk__in=batch).update(pub_date=pub_date)
+        last = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата публикации'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_pub_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
@@ -19,19 +21,37 @@ class Post(models.Model):
     text = models.TextField(verbose_name='Текст')
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True,
                                     db_index=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(User, verbose_name='Автор',
                                related_name='posts', on_delete=models.CASCADE)
     group = models.ForeignKey(Group, verbose_name='Сообщество',
                               related_name='posts', blank=True, null=True,
                               on_delete=models.SET_NULL)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image_renditions = models.TextField('Уменьшенные копии', blank=True,
+                                        default='', editable=False)
+    comment_count = models.PositiveIntegerField('Комментариев', default=0,
+                                                editable=False)
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return f'{self.author}: {self.text[:15]}'
 
+    @property
+    def renditions(self):
+        """Готовые копии картинки: {имя: {'url', 'width', 'height'}}."""
+        if not self.image_renditions:
+            return {}
+        return json.loads(self.image_renditions)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
@@ -42,7 +62,14 @@ class Comment(models.Model):
                                related_name='comments')
     text = models.TextField()
     created = models.DateTimeField(auto_now_add=True,
-                                   verbose_name='Дата создания')
+                                   verbose_name='Дата создания',
+                                   db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('post', 'created'),
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -52,3 +79,43 @@ class Follow(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                verbose_name='Автор',
                                related_name='following')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True,
+                                verbose_name='Пользователь',
+                                related_name='stats')
+    posts_count = models.PositiveIntegerField('Записей', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    def __str__(self):
+        return f'{self.user}: {self.posts_count}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='Читатель',
+                             related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             verbose_name='Запись',
+                             related_name='timeline_entries')
+    # Копия Post.pub_date: лента листается по индексу этой таблицы
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date_idx'),
+        ]
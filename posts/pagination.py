@@ -0,0 +1,324 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from yatube.caches import versioned_timeout
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает пару (значение, pk) или None для битого курсора."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = raw.decode().rsplit('|', 1)
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def _beyond(field, pk, lookup, value, pk_value):
+    """Условие «дальше ключа (value, pk_value)» для lookup 'lt' или 'gt'.
+
+    Первое условие — диапазон по одному полю: по нему SQLite ищет в индексе
+    (SEARCH), а одно OR заставило бы просматривать индекс от начала.
+    """
+    return (Q(**{f'{field}__{lookup}e': value})
+            & (Q(**{f'{field}__{lookup}': value})
+               | Q(**{field: value, f'{pk}__{lookup}': pk_value})))
+
+
+def _pk(row):
+    # Строки из values() — словари
+    return row['id'] if isinstance(row, dict) else row.pk
+
+
+class MergedFeed:
+    """Лента из нескольких источников, каждый листается своим индексом.
+
+    sources возвращает пары (запрос, имя поля id записи): из каждого
+    запроса страница берет ключи (поле пагинатора, id записи), сливает их
+    и загружает записи страницы из queryset одним запросом по id. Так ни
+    один запрос не сортирует ленту целиком. Навигация по номерам страниц
+    (count и срезы) читает queryset с условием where.
+    """
+
+    def __init__(self, queryset, where, sources):
+        self.queryset = queryset
+        self.where = where
+        self.sources = sources
+
+    def values(self, *fields):
+        return MergedFeed(self.queryset.values(*fields), self.where,
+                          self.sources)
+
+    def _all(self):
+        return self.queryset.filter(self.where).order_by('-pub_date', '-pk')
+
+    def count(self):
+        return self._all().count()
+
+    def __getitem__(self, index):
+        return self._all()[index]
+
+    def fetch(self, page):
+        """Строки страницы в порядке ее запроса, с одной лишней."""
+        field = page.paginator.field
+        keys = set()
+        for queryset, pk in self.sources():
+            # Одна запись может прийти из двух источников: set убирает
+            # повтор, а per_page + 1 ключей каждого хватает на страницу
+            keys.update(page.keyset(queryset.values_list(field, pk), pk))
+        keys = sorted(keys, reverse=page.descending)
+        keys = keys[:page.paginator.per_page + 1]
+        ids = [pk for _, pk in keys]
+        rows = {_pk(row): row
+                for row in self.queryset.filter(pk__in=ids).order_by()}
+        return [rows[pk] for pk in ids if pk in rows]
+
+
+class CursorPage:
+    """Страница ленты, выбранная по ключу (поле, id) без OFFSET и COUNT.
+
+    Запрос выполняется лениво, при первом обращении к записям, поэтому
+    страница, отрисованная из кэша, не обращается к базе.
+    """
+
+    def __init__(self, paginator, after=None, before=None):
+        self.paginator = paginator
+        self.after = after
+        self.before = before
+        # «Дальше» — к меньшим значениям при убывании и к большим при
+        # возрастании; страница назад читается в обратном порядке
+        self.descending = paginator.descending == (before is None)
+
+    def keyset(self, queryset, pk='pk'):
+        """Запрос страницы с одной лишней строкой для has_next."""
+        field = self.paginator.field
+        cursor = self.before if self.before is not None else self.after
+        if cursor is not None:
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(_beyond(field, pk, lookup, *cursor))
+        order = '-' if self.descending else ''
+        queryset = queryset.order_by(f'{order}{field}', f'{order}{pk}')
+        return queryset[:self.paginator.per_page + 1]
+
+    @property
+    def queryset(self):
+        return self.keyset(self.paginator.queryset)
+
+    @cached_property
+    def _rows(self):
+        per_page = self.paginator.per_page
+        source = self.paginator.queryset
+        if isinstance(source, MergedFeed):
+            rows = source.fetch(self)
+        else:
+            rows = list(self.queryset)
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if self.before is not None:
+            rows.reverse()
+        return rows, has_more
+
+    @property
+    def object_list(self):
+        return self._rows[0]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        # Как у django.core.paginator.Page: шаблон сначала пробует
+        # page['attr'], и это не должно выполнять запрос
+        if not isinstance(index, (int, slice)):
+            raise TypeError(f'Page indices must be integers or slices, '
+                            f'not {type(index).__name__}.')
+        return self.object_list[index]
+
+    def has_next(self):
+        if self.before is not None:
+            return True
+        return self._rows[1]
+
+    def has_previous(self):
+        if self.before is not None:
+            return self._rows[1]
+        return self.after is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def _cursor(self, obj):
+        if isinstance(obj, dict):
+            # Строки из values()
+            return encode_cursor(obj[self.paginator.field], obj['id'])
+        return encode_cursor(getattr(obj, self.paginator.field), obj.pk)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return self._cursor(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return self._cursor(self.object_list[0])
+
+
+class CursorPaginator:
+    """Постраничная навигация по ключу (field, id).
+
+    По умолчанию ключ убывает (сначала новые), с descending=False —
+    возрастает.
+
+    Вместо номеров страниц использует непрозрачные токены ``?after=``
+    и ``?before=``; общее число записей не считается.
+    """
+    is_cursor = True
+
+    def __init__(self, queryset, per_page, field='pub_date',
+                 descending=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+        self.descending = descending
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after)
+        before = decode_cursor(before)
+        if before is not None:
+            after = None
+        return CursorPage(self, after=after, before=before)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Нумерованные страницы без COUNT(*) по всей таблице.
+
+    Для запроса без фильтров число записей оценивается: в PostgreSQL по
+    статистике планировщика, в остальных базах по наибольшему id, который
+    берется из индекса. Оценка завышена на число удаленных строк, поэтому
+    таблицы меньше ADMIN_EXACT_COUNT_LIMIT считаются точно, как и любые
+    отфильтрованные запросы.
+
+    Из-за завышенной оценки последние страницы могут оказаться пустыми.
+    Неполная страница дает точное число строк без COUNT(*), а вместо
+    пустой отдается настоящая последняя страница.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where and not query.distinct:
+            estimate = self.estimate()
+            if (estimate is not None
+                    and estimate >= settings.ADMIN_EXACT_COUNT_LIMIT):
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def _set_count(self, count):
+        self.estimated = False
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+
+    def page(self, number):
+        page = super().page(number)
+        if not self.estimated:
+            return page
+        page.object_list = list(page.object_list)
+        if len(page.object_list) < self.per_page:
+            if page.object_list or page.number == 1:
+                self._set_count((page.number - 1) * self.per_page
+                                + len(page.object_list))
+                return page
+            self._set_count(super().count)
+            return self.page(self.num_pages)
+        return page
+
+    def estimate(self):
+        queryset = self.object_list
+        model = queryset.model
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class '
+                               'WHERE oid = %s::regclass',
+                               [model._meta.db_table])
+                row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+        if model._meta.pk.get_internal_type() not in ('AutoField',
+                                                      'BigAutoField'):
+            return None
+        return (model._default_manager.using(queryset.db)
+                .aggregate(estimate=Max('pk'))['estimate'] or 0)
+
+
+PAGE_PARAMS = {'page', 'after', 'before'}
+
+
+def page_key(page):
+    """Проверенный курсор или номер страницы для ключей кэша.
+
+    Битый курсор дает ключ первой страницы, как и сама страница.
+    """
+    if isinstance(page, CursorPage):
+        if page.before is not None:
+            return 'before:' + encode_cursor(*page.before)
+        if page.after is not None:
+            return 'after:' + encode_cursor(*page.after)
+        return 'first'
+    return f'page:{page.number}'
+
+
+def page_cache_key(request, page):
+    """Ключ страницы ленты для кэша фрагментов.
+
+    Запросы с другими параметрами не кэшируются: ссылки паджинатора
+    сохраняют эти параметры, а произвольные строки запроса вытесняли бы
+    из кэша настоящие страницы.
+    """
+    if set(request.GET) - PAGE_PARAMS:
+        return None
+    return page_key(page)
+
+
+def paginate(request, queryset):
+    """Возвращает пару (page, paginator) в режиме POSTS_PAGINATION.
+
+    У страницы есть cache_key и cache_timeout для кэша фрагментов
+    (templates/feed_page.html).
+    """
+    per_page = settings.POSTS_PER_PAGE
+    if settings.POSTS_PAGINATION == 'pages':
+        paginator = Paginator(queryset, per_page)
+        page = paginator.get_page(request.GET.get('page'))
+    else:
+        paginator = CursorPaginator(queryset, per_page)
+        page = paginator.get_page(after=request.GET.get('after'),
+                                  before=request.GET.get('before'))
+    page.cache_key = page_cache_key(request, page)
+    page.cache_timeout = versioned_timeout(
+        settings.POSTS_PAGE_FRAGMENT_TIMEOUT)
+    return page, paginator
@@ -0,0 +1,172 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+from jobs.queue import enqueue
+from PIL import Image, ImageOps
+
+from . import versions
+from .models import Post
+
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp',
+              'JPEG': 'image/jpeg'}
+
+# Картинку автор ждет на странице записи: раньше прочих задач
+PRIORITY = 10
+
+
+def supported_formats(formats):
+    """Форматы из настроек, которые умеет сохранять установленный Pillow.
+
+    JPEG для запасного <img> добавляется всегда и идет последним.
+    """
+    Image.init()
+    formats = [fmt.upper() for fmt in formats]
+    return [fmt for fmt in formats
+            if fmt in Image.SAVE and fmt != 'JPEG'] + ['JPEG']
+
+
+def resize(image, size, crop):
+    if crop:
+        return ImageOps.fit(image, size, Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+def render_files(source, media_root, directory, stem, specs, formats,
+                 quality):
+    """Сохраняет копии картинки во всех ширинах и форматах.
+
+    Работает только с путями в файловой системе и без Django ORM, чтобы
+    выполняться в отдельном процессе. Возвращает для каждой копии
+    размеры и списки файлов по форматам.
+    """
+    os.makedirs(os.path.join(media_root, directory), exist_ok=True)
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    result = {}
+    for name, spec in specs.items():
+        base = resize(image, spec['size'], spec['crop'])
+        widths = sorted({min(width, base.width)
+                         for width in spec.get('widths', (base.width,))})
+        files = {fmt: [] for fmt in formats}
+        for width in widths:
+            height = round(base.height * width / base.width)
+            variant = (base if width == base.width
+                       else base.resize((width, height), Image.LANCZOS))
+            for fmt in formats:
+                path = f'{directory}/{stem}_{name}_{width}.{fmt.lower()}'
+                variant.save(os.path.join(media_root, path), fmt,
+                             quality=quality)
+                files[fmt].append((path, width))
+        result[name] = {'width': base.width, 'height': base.height,
+                        'files': files}
+    return result
+
+
+def _srcset(storage, files):
+    return ', '.join(f'{storage.url(path)} {width}w'
+                     for path, width in files)
+
+
+def _describe(storage, rendered):
+    """Адреса и srcset для шаблонов по результату render_files."""
+    renditions = {}
+    for name, rendition in rendered.items():
+        files = rendition['files']
+        jpeg = files['JPEG']
+        renditions[name] = {
+            'url': storage.url(jpeg[-1][0]),
+            'width': rendition['width'],
+            'height': rendition['height'],
+            'srcset': _srcset(storage, jpeg),
+            'sources': [{'type': MIME_TYPES[fmt],
+                         'srcset': _srcset(storage, files[fmt])}
+                        for fmt in files if fmt != 'JPEG'],
+            'files': [path for paths in files.values()
+                      for path, width in paths],
+        }
+    return renditions
+
+
+def _remove_files(storage, renditions, keep=()):
+    for rendition in renditions.values():
+        for path in rendition.get('files', ()):
+            if path not in keep and storage.exists(path):
+                storage.delete(path)
+
+
+def is_supported(storage):
+    """render_files пишет файлы по путям, поэтому копии готовятся только
+    для FileSystemStorage; с другими хранилищами шаблоны показывают
+    оригинал."""
+    return isinstance(storage, FileSystemStorage)
+
+
+def generate(post_id, pool=None):
+    """Готовит все копии картинки записи и сохраняет их адреса в записи.
+
+    Если передан пул процессов, обработка картинки идет в нем.
+    """
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not is_supported(post.image.storage):
+        return
+    storage = post.image.storage
+    old = post.renditions
+    renditions = {}
+    if post.image:
+        args = (post.image.path, storage.location, f'renditions/{post.pk}',
+                os.path.splitext(os.path.basename(post.image.name))[0],
+                settings.POST_IMAGE_RENDITIONS,
+                supported_formats(settings.POST_IMAGE_FORMATS),
+                settings.POST_IMAGE_QUALITY)
+        if pool is None:
+            rendered = render_files(*args)
+        else:
+            rendered = pool.submit(render_files, *args).result()
+        renditions = _describe(storage, rendered)
+    posts = Post.objects.filter(pk=post.pk)
+    if post.image:
+        posts = posts.filter(image=post.image.name)
+    updated = posts.update(
+        image_renditions=json.dumps(renditions) if renditions else '',
+        updated=timezone.now())
+    if not updated:
+        # Картинку успели сменить, копии подготовит следующая задача
+        _remove_files(storage, renditions)
+        return
+    _remove_files(storage, old, keep={
+        path for rendition in renditions.values()
+        for path in rendition['files']})
+    versions.bump(*versions.post_scopes(post.author_id, post.group_id))
+
+
+def discard(post):
+    """Сбрасывает копии прежней картинки до сохранения записи.
+
+    Пока новые копии не готовы, шаблоны показывают новый оригинал, а не
+    прежнюю картинку. Файлы прежних копий удаляются после фиксации.
+    """
+    old = post.renditions
+    post.image_renditions = ''
+    if old:
+        storage = post.image.storage
+        transaction.on_commit(lambda: _remove_files(storage, old))
+
+
+def schedule(post):
+    """Ставит подготовку копий в очередь в текущей транзакции.
+
+    Без POST_IMAGE_ASYNC копии готовятся сразу после фиксации.
+    """
+    if not is_supported(post.image.storage):
+        return
+    if settings.POST_IMAGE_ASYNC:
+        enqueue('posts.renditions.generate', priority=PRIORITY,
+                dedup_key=f'renditions:{post.pk}', post_id=post.pk)
+    else:
+        transaction.on_commit(lambda: generate(post.pk))
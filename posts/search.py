@@ -0,0 +1,256 @@
+"""Полнотекстовый поиск по записям и комментариям.
+
+Тексты перед индексацией и запросы перед поиском приводятся к начальным
+формам слов через pymorphy2, поэтому «котами» находит «коты». Слово с
+несколькими разборами индексируется во всех начальных формах, а в запросе
+они объединяются через OR. Движок выбирается настройкой
+POSTS_SEARCH_BACKEND.
+"""
+import base64
+import binascii
+import json
+import math
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from users.declension import get_morph
+
+from .models import Comment, Post
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+@lru_cache(maxsize=100_000)
+def normal_forms(word):
+    return tuple(dict.fromkeys(parse.normal_form
+                               for parse in get_morph().parse(word)))
+
+
+def query_terms(text):
+    return [normal_forms(word) for word in WORD_RE.findall(text.lower())]
+
+
+def normalize(text):
+    return ' '.join(form for forms in query_terms(text) for form in forms)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _cursor_values(token, *kinds):
+    """Значения курсора, если их число и типы совпадают с kinds.
+
+    Курсор приходит из запроса и подставляется в SQL, поэтому любой
+    другой курсор, например [{}, 1, 2], дает первую страницу.
+    """
+    values = decode_cursor(token)
+    if values is None or len(values) != len(kinds):
+        return None
+    for value, kind in zip(values, kinds):
+        if isinstance(value, bool) or not isinstance(value, kind):
+            return None
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+    return values
+
+
+class SearchPage:
+    """Страница результатов: id записей и курсор следующей страницы."""
+
+    def __init__(self, post_ids, next_cursor=None):
+        self.post_ids = post_ids
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class SearchBackend:
+    """Интерфейс поискового движка."""
+
+    def index_post(self, post):
+        raise NotImplementedError
+
+    def index_comment(self, comment):
+        raise NotImplementedError
+
+    def remove_post(self, post_id):
+        raise NotImplementedError
+
+    def remove_comment(self, comment_id):
+        raise NotImplementedError
+
+    def rebuild(self, batch_size=1000):
+        raise NotImplementedError
+
+    def search(self, query, cursor=None, limit=10):
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """Поиск через LIKE без индекса: запасной вариант для любой базы."""
+
+    def index_post(self, post):
+        pass
+
+    def index_comment(self, comment):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def remove_comment(self, comment_id):
+        pass
+
+    def rebuild(self, batch_size=1000):
+        return 0
+
+    def search(self, query, cursor=None, limit=10):
+        words = WORD_RE.findall(query)
+        if not words:
+            return SearchPage([])
+        posts = Post.objects.all()
+        for word in words:
+            posts = posts.filter(Q(text__icontains=word)
+                                 | Q(comments__text__icontains=word))
+        values = _cursor_values(cursor, int)
+        if values is not None:
+            posts = posts.filter(pk__lt=values[0])
+        post_ids = list(posts.distinct().order_by('-pk')
+                        .values_list('pk', flat=True)[:limit + 1])
+        next_cursor = None
+        if len(post_ids) > limit:
+            post_ids = post_ids[:limit]
+            next_cursor = encode_cursor([post_ids[-1]])
+        return SearchPage(post_ids, next_cursor)
+
+
+class SqliteSearchBackend(SearchBackend):
+    """Поиск по таблице SQLite FTS5 posts_search.
+
+    Релевантность — bm25 лучшего совпадения среди записи и ее
+    комментариев, деленная на 1 + возраст записи в единицах
+    POSTS_SEARCH_DECAY_DAYS дней. Курсор хранит момент первого запроса,
+    поэтому порядок результатов не сдвигается при листании.
+    """
+    table = 'posts_search'
+
+    def _execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _insert(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.table} '
+                f'(content, kind, object_id, post_id) VALUES (%s, %s, %s, %s)',
+                rows)
+
+    def index_post(self, post):
+        self._execute(f"DELETE FROM {self.table} "
+                      f"WHERE kind = 'post' AND object_id = %s", [post.pk])
+        self._insert([(normalize(post.text), 'post', post.pk, post.pk)])
+
+    def index_comment(self, comment):
+        self.remove_comment(comment.pk)
+        self._insert([(normalize(comment.text), 'comment', comment.pk,
+                       comment.post_id)])
+
+    def remove_post(self, post_id):
+        self._execute(f'DELETE FROM {self.table} WHERE post_id = %s',
+                      [post_id])
+
+    def remove_comment(self, comment_id):
+        self._execute(f"DELETE FROM {self.table} "
+                      f"WHERE kind = 'comment' AND object_id = %s",
+                      [comment_id])
+
+    @transaction.atomic
+    def rebuild(self, batch_size=1000):
+        self._execute(f'DELETE FROM {self.table}')
+        indexed = 0
+        sources = (
+            ('post', Post.objects.values_list('pk', 'text', 'pk')),
+            ('comment', Comment.objects.values_list('pk', 'text', 'post_id')),
+        )
+        for kind, rows in sources:
+            batch = []
+            for pk, text, post_id in rows.order_by('pk').iterator(
+                    chunk_size=batch_size):
+                batch.append((normalize(text), kind, pk, post_id))
+                if len(batch) >= batch_size:
+                    self._insert(batch)
+                    indexed += len(batch)
+                    batch = []
+            self._insert(batch)
+            indexed += len(batch)
+        return indexed
+
+    def search(self, query, cursor=None, limit=10):
+        terms = query_terms(query)
+        if not terms:
+            return SearchPage([])
+        match = ' AND '.join(
+            '({})'.format(' OR '.join(
+                '"{}"'.format(form.replace('"', '""')) for form in forms))
+            for forms in terms)
+        values = _cursor_values(cursor, (int, float), (int, float), int)
+        if values is not None:
+            now, score, post_id = values
+            after = 'WHERE score > %s OR (score = %s AND post_id < %s)'
+            after_params = [score, score, post_id]
+        else:
+            now = timezone.now().timestamp()
+            after, after_params = '', []
+        rows = self._execute(
+            f'''
+            WITH hits AS (
+                SELECT post_id, MIN(rank) AS relevance
+                FROM {self.table} WHERE {self.table} MATCH %s
+                GROUP BY post_id
+            ), ranked AS (
+                SELECT hits.post_id AS post_id,
+                       hits.relevance / (1 + (%s / 86400.0 + 2440587.5
+                           - julianday(posts_post.pub_date)) / %s) AS score
+                FROM hits JOIN posts_post ON posts_post.id = hits.post_id
+            )
+            SELECT post_id, score FROM ranked {after}
+            ORDER BY score, post_id DESC LIMIT %s
+            ''',
+            [match, now, settings.POSTS_SEARCH_DECAY_DAYS, *after_params,
+             limit + 1])
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            post_id, score = rows[-1]
+            next_cursor = encode_cursor([now, score, post_id])
+        return SearchPage([post_id for post_id, score in rows], next_cursor)
+
+
+@lru_cache(maxsize=None)
+def _backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _backend(settings.POSTS_SEARCH_BACKEND)
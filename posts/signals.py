@@ -0,0 +1,145 @@
+"""Сигналы моделей: счетчики, ленты, версии кэша и поисковый индекс.
+
+Счетчики, раскладка по лентам и смена версий выполняются после фиксации
+транзакции (transaction.on_commit): транзакция записи остается короткой, а
+параллельный читатель не закэширует страницу, собранную из данных до
+фиксации, под уже новой версией. Поисковый индекс пишется в той же
+транзакции, что и данные.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, follows, search, timeline, versions
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+        # id удаленного пользователя может достаться новому
+        follows.forget(instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    if instance.pk is None or raw:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    instance._saved_username = (User.objects
+                                .filter(pk=instance.pk)
+                                .values_list('username', flat=True)
+                                .first())
+
+
+@receiver(post_save, sender=User)
+def username_changed(sender, instance, created, raw=False, **kwargs):
+    # Имя автора есть в карточках записей во всех лентах
+    saved = getattr(instance, '_saved_username', None)
+    if not created and saved not in (None, instance.username):
+        versions.bump(versions.ALL)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, raw=False, **kwargs):
+    # Название сообщества есть в карточках его записей во всех лентах
+    if not created and not raw:
+        versions.bump(versions.ALL)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # Записи сообщества остаются без него: group_id сбрасывается UPDATE
+    # в обход сигналов Post
+    versions.bump(versions.ALL)
+
+
+def _bump_post_feeds(post_id):
+    ids = Post.objects.filter(pk=post_id).values_list('author_id',
+                                                      'group_id').first()
+    if ids is not None:
+        versions.bump(*versions.post_scopes(*ids))
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._saved_group_id = (Post.objects
+                                    .filter(pk=instance.pk)
+                                    .values_list('group_id', flat=True)
+                                    .first())
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        transaction.on_commit(lambda: post_created(instance))
+    scopes = versions.post_scopes(instance.author_id, instance.group_id)
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    if saved_group_id not in (None, instance.group_id):
+        scopes.append(('group', saved_group_id))
+    versions.bump(*scopes)
+    search.get_backend().index_post(instance)
+
+
+def post_created(post):
+    counters.bump_stats(post.author_id, 'posts_count', 1)
+    timeline.fan_out(post)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: counters.bump_stats(
+        instance.author_id, 'posts_count', -1))
+    versions.bump(*versions.post_scopes(instance.author_id,
+                                        instance.group_id))
+    search.get_backend().remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        transaction.on_commit(lambda: comment_changed(instance, 1))
+    versions.bump(('comments', instance.post_id))
+    search.get_backend().index_comment(instance)
+
+
+def comment_changed(comment, delta):
+    counters.bump_comments(comment.post_id, delta)
+    _bump_post_feeds(comment.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: comment_changed(instance, -1))
+    versions.bump(('comments', instance.post_id))
+    search.get_backend().remove_comment(instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: follow_changed(instance, 1))
+
+
+def follow_changed(follow, delta):
+    follows.forget(follow.user_id)
+    counters.bump_stats(follow.user_id, 'following_count', delta)
+    counters.bump_stats(follow.author_id, 'followers_count', delta)
+    if delta > 0:
+        timeline.backfill(follow.user_id, follow.author_id)
+    else:
+        timeline.unfollowed(follow.user_id, follow.author_id)
+    versions.bump(('follow', follow.user_id), *versions.stats_scopes(follow))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: follow_changed(instance, -1))
@@ -0,0 +1,13 @@
+from django import template
+
+from ..fragments import attach_fragments
+from ..models import Post
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_fragments(posts):
+    if isinstance(posts, Post):
+        posts = [posts]
+    return attach_fragments(posts)
@@ -0,0 +1,18 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def replace_query(context, **params):
+    """Строка запроса текущей страницы с замененными параметрами.
+
+    Параметр со значением None удаляется, остальные параметры запроса
+    (поисковая строка, фильтры) сохраняются.
+    """
+    query = context['request'].GET.copy()
+    for key, value in params.items():
+        query.pop(key, None)
+        if value is not None:
+            query[key] = value
+    return '?' + query.urlencode()
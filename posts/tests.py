@@ -1,10 +1,43 @@
-import time
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, override_settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date
+from PIL import Image
 
-from .models import Group, Post
+from benchmarks.seed import Dataset, seed
+from jobs import queue as jobs_queue
+from jobs.models import Job
+from yatube import metrics, routers
+from yatube.handlers import ASGIHandler, environ_for
+from yatube.middleware import MetricsMiddleware
+from yatube.querycheck import query_budget, shape
+from yatube.testing import TestCase
+
+from . import (feeds, fragments, renditions, search, timeline, transfer,
+               versions)
+from .forms import PostForm
+from .models import Comment, Follow, Group, Post, TimelineEntry, UserStats
+from .pagination import CursorPaginator, EstimatedCountPaginator, encode_cursor
 
 User = get_user_model()
 
@@ -207,23 +240,133 @@ class TestNotImage(TestCase):
                           msg='PDF загружается')
 
 
-class TestLagCache(TestCase):
+class TestFeedCache(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username='bum',
                                              password='password')
+        self.group = Group.objects.create(title='testgroup',
+                                          slug='testgroup')
         self.client.force_login(self.user)
 
-    def test_cache(self):
+    def test_new_post_shown_at_once(self):
+        self.client.get(reverse('index'))
         self.client.post(reverse('new_post'),
                          {'text': 'Some text'}, follow=True)
         response = self.client.get(reverse('index'))
-        self.assertNotContains(response, 'Some text',
-                               msg_prefix='Пост появился слишком рано')
-        time.sleep(20)
-        response = self.client.get(reverse('index'))
         self.assertContains(response, 'Some text',
                             msg_prefix='Пост не появился')
 
+    def test_unchanged_feed_served_from_cache(self):
+        Post.objects.create(text='First', author=self.user)
+        self.client.get(reverse('index'))
+        # bulk_create не посылает сигналов, версия ленты не меняется
+        Post.objects.bulk_create([Post(text='Silent', author=self.user)])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'Silent',
+                               msg_prefix='Фрагмент не взят из кэша')
+        self.assertFalse(
+            any('FROM "posts_post"' in q['sql'] for q in queries),
+            msg='Закэшированная лента обращается к базе')
+
+    def test_edit_invalidates_old_and_new_group(self):
+        post = Post.objects.create(text='Text', author=self.user,
+                                   group=self.group)
+        other = Group.objects.create(title='other', slug='other')
+        old_url = reverse('group_posts', args=['testgroup'])
+        new_url = reverse('group_posts', args=['other'])
+        self.assertContains(self.client.get(old_url), 'Text')
+        self.client.get(new_url)
+
+        self.client.post(reverse('post_edit', kwargs={
+            'username': 'bum', 'post_id': post.pk}),
+            {'text': 'Text', 'group': other.pk})
+
+        self.assertNotContains(self.client.get(old_url), 'Text',
+                               msg_prefix='Старая группа не обновилась')
+        self.assertContains(self.client.get(new_url), 'Text',
+                            msg_prefix='Новая группа не обновилась')
+
+    def test_comment_and_follow_invalidate(self):
+        author = User.objects.create_user(username='author',
+                                          password='password')
+        post = Post.objects.create(text='Text', author=author)
+        self.client.post(reverse('profile_follow', kwargs={
+            'username': 'author'}))
+        self.assertContains(self.client.get(reverse('follow_index')),
+                            'Добавить комментарий')
+        self.client.post(reverse('add_comment', kwargs={
+            'username': 'author', 'post_id': post.pk}), {'text': 'Hi'})
+        self.assertContains(self.client.get(reverse('follow_index')),
+                            '1 комментарий',
+                            msg_prefix='Комментарий не сбросил кэш ленты')
+        self.client.post(reverse('profile_unfollow', kwargs={
+            'username': 'author'}))
+        self.assertNotContains(self.client.get(reverse('follow_index')),
+                               'Text',
+                               msg_prefix='Отписка не сбросила кэш ленты')
+
+    def test_arbitrary_params_are_not_cached(self):
+        Post.objects.create(text='Text', author=self.user)
+
+        def fragments():
+            return [key for key in cache._cache
+                    if 'template.cache.feed_page' in key]
+
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'), {'after': 'не-курсор'})
+        self.assertEqual(len(fragments()), 1,
+                         msg='Битый курсор дал отдельный фрагмент')
+        for value in range(3):
+            self.client.get(reverse('index'), {'x': value})
+        self.assertEqual(len(fragments()), 1,
+                         msg='Произвольные параметры попадают в кэш')
+
+    def test_versions_change_after_commit(self):
+        index_version = versions.feed_key(('index',))
+        with transaction.atomic():
+            Post.objects.create(text='Text', author=self.user)
+            self.assertEqual(versions.feed_key(('index',)), index_version,
+                             msg='Версия сменилась до фиксации записи')
+        self.assertNotEqual(versions.feed_key(('index',)), index_version,
+                            msg='Версия не сменилась после фиксации')
+        index_version = versions.feed_key(('index',))
+        try:
+            with transaction.atomic():
+                Post.objects.create(text='Text', author=self.user)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(versions.feed_key(('index',)), index_version,
+                         msg='Откат транзакции сменил версию')
+
+    def test_local_cache_keeps_versions_briefly(self):
+        with mock.patch.object(cache, 'add', wraps=cache.add) as add:
+            versions.feed_key(('index',))
+        self.assertEqual(add.call_args[0][2], settings.LOCAL_CACHE_TIMEOUT,
+                         msg='Версия в кэше процесса живет слишком долго')
+
+    def test_group_and_username_changes_bump_feeds(self):
+        index_version = versions.feed_key(('index',))
+        self.group.title = 'renamed'
+        self.group.save()
+        self.assertNotEqual(versions.feed_key(('index',)), index_version,
+                            msg='Переименование сообщества не сбросило кэш')
+        index_version = versions.feed_key(('index',))
+        self.user.last_login = self.user.date_joined
+        self.user.save(update_fields=['last_login'])
+        self.assertEqual(versions.feed_key(('index',)), index_version,
+                         msg='Вход пользователя сбросил кэш лент')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertNotEqual(versions.feed_key(('index',)), index_version,
+                            msg='Смена имени автора не сбросила кэш')
+        index_version = versions.feed_key(('index',))
+        self.group.delete()
+        self.assertNotEqual(versions.feed_key(('index',)), index_version,
+                            msg='Удаление сообщества не сбросило кэш')
+
 
 class TestFollowersSeeNewPost(TestCase):
     def setUp(self):
@@ -341,3 +484,1491 @@ class TestFollow(TestCase):
 
         follows = self.user.follower.count()
         self.assertEqual(follows, 0, msg='Есть подписки')
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        Post.objects.bulk_create(
+            Post(text=f'Post {i}', author=self.user) for i in range(25)
+        )
+        self.url = reverse('profile', kwargs={'username': 'bum'})
+
+    def walk(self):
+        seen = []
+        response = self.client.get(self.url)
+        while True:
+            page = response.context['page']
+            seen.extend(post.pk for post in page)
+            if not page.has_next():
+                return seen, page
+            response = self.client.get(self.url,
+                                       {'after': page.next_cursor})
+
+    def test_pages_cover_feed_in_order(self):
+        seen, last_page = self.walk()
+        expected = list(Post.objects.values_list('pk', flat=True))
+        self.assertEqual(seen, expected,
+                         msg='Курсоры пропускают или повторяют записи')
+        self.assertEqual(len(last_page), 5, msg='Неверная последняя страница')
+
+    def test_before_returns_previous_page(self):
+        first = self.client.get(self.url).context['page']
+        second = self.client.get(
+            self.url, {'after': first.next_cursor}).context['page']
+        back = self.client.get(
+            self.url, {'before': second.previous_cursor}).context['page']
+        self.assertEqual([p.pk for p in back], [p.pk for p in first],
+                         msg='Переход назад не возвращает прежнюю страницу')
+        self.assertFalse(back.has_previous(), msg='Есть страница до первой')
+
+    def test_links_keep_other_params(self):
+        first = self.client.get(self.url).context['page']
+        response = self.client.get(self.url, {'tag': 'x',
+                                              'after': first.next_cursor})
+        page = response.context['page']
+        self.assertContains(response, 'href="?tag=x&amp;after='
+                            f'{page.next_cursor}"',
+                            msg_prefix='Ссылка вперед теряет параметры')
+        self.assertContains(response, 'href="?tag=x&amp;before='
+                            f'{page.previous_cursor}"',
+                            msg_prefix='Ссылка назад теряет параметры')
+        self.assertContains(response, 'href="?tag=x"',
+                            msg_prefix='Ссылка в начало теряет параметры')
+
+    def test_broken_cursor_gives_first_page(self):
+        response = self.client.get(self.url, {'after': 'не-курсор'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page'].has_previous(),
+                         msg='Битый курсор не ведет на первую страницу')
+
+    @override_settings(CACHES=DUMMY_CACHE)
+    def test_first_page_does_not_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        self.assertFalse(
+            any(q['sql'].startswith('SELECT COUNT(*) FROM "posts_post"')
+                for q in queries),
+            msg='Первая страница считает все записи')
+
+    @override_settings(POSTS_PAGINATION='pages')
+    def test_page_number_mode(self):
+        response = self.client.get(self.url, {'page': 3})
+        page = response.context['page']
+        self.assertEqual(page.number, 3, msg='Не работает режим страниц')
+        self.assertEqual(len(page), 5)
+
+
+@override_settings(CACHES=DUMMY_CACHE)
+class TestFeedQueryBudget(TestCase):
+    # Сессия и пользователь + запросы самой страницы. Лента подписок:
+    # подписки, популярные авторы, ключи ленты читателя и записи; еще по
+    # запросу на каждого популярного автора
+    BUDGETS = {'index': 3, 'group_posts': 4, 'follow_index': 6,
+               'profile': 5}
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.group = Group.objects.create(title='testgroup',
+                                          slug='testgroup')
+        self.user.follower.create(author=self.author)
+        self.client.force_login(self.user)
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'Post {i}', author=self.author,
+                                       group=self.group)
+            post.comments.create(author=self.user, text='Comment')
+
+    def count_queries(self, name, **kwargs):
+        with query_budget(self.BUDGETS[name]) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        return queries.count
+
+    def test_feed_queries_do_not_grow_with_page(self):
+        feeds = [('index', {}), ('group_posts', {'slug': 'testgroup'}),
+                 ('follow_index', {})]
+        self.add_posts(2)
+        small = {name: self.count_queries(name, **kw) for name, kw in feeds}
+        self.add_posts(8)
+        for name, kwargs in feeds:
+            with self.subTest(feed=name):
+                queries = self.count_queries(name, **kwargs)
+                self.assertEqual(queries, small[name],
+                                 msg='Число запросов растет с числом постов')
+                self.assertLessEqual(queries, self.BUDGETS[name],
+                                     msg='Превышен бюджет запросов')
+
+    def test_profile_queries_do_not_grow_with_page(self):
+        self.add_posts(2)
+        small = self.count_queries('profile', username='author')
+        self.add_posts(8)
+        queries = self.count_queries('profile', username='author')
+        self.assertEqual(queries, small,
+                         msg='Число запросов растет с числом постов')
+        self.assertLessEqual(queries, self.BUDGETS['profile'],
+                             msg='Превышен бюджет запросов')
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.client.force_login(self.user)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_views_update_counters(self):
+        self.client.post(reverse('new_post'), {'text': 'Text'})
+        post = Post.objects.get()
+        self.client.post(reverse('add_comment', kwargs={
+            'username': 'bum', 'post_id': post.pk}), {'text': 'Comment'})
+        self.client.post(reverse('profile_follow', kwargs={
+            'username': 'author'}))
+
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1,
+                         msg='Не учтен комментарий')
+        self.assertEqual(self.stats(self.user).posts_count, 1,
+                         msg='Не учтена запись')
+        self.assertEqual(self.stats(self.user).following_count, 1,
+                         msg='Не учтена подписка')
+        self.assertEqual(self.stats(self.author).followers_count, 1,
+                         msg='Не учтен подписчик')
+
+        self.client.post(reverse('profile_unfollow', kwargs={
+            'username': 'author'}))
+        post.delete()
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+
+    def test_counters_shown_on_profile(self):
+        Post.objects.create(text='Text', author=self.author)
+        response = self.client.get(reverse('profile', kwargs={
+            'username': 'author'}))
+        self.assertContains(response, 'Записей: 1',
+                            msg_prefix='Нет числа записей')
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(text='Text', author=self.author)
+        Comment.objects.create(post=post, author=self.user, text='Comment')
+        Post.objects.update(comment_count=42)
+        UserStats.objects.update(posts_count=7)
+        UserStats.objects.filter(user=self.user).delete()
+
+        call_command('recount_counters', stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1,
+                         msg='Счетчик комментариев не исправлен')
+        self.assertEqual(self.stats(self.author).posts_count, 1,
+                         msg='Счетчик записей не исправлен')
+        self.assertEqual(self.stats(self.user).posts_count, 0,
+                         msg='Не создана статистика пользователя')
+
+    def test_drift_enqueues_recount(self):
+        post = Post.objects.create(text='Text', author=self.author)
+        comment = Comment.objects.create(post=post, author=self.user,
+                                         text='Comment')
+        self.assertFalse(Job.objects.exists())
+        Post.objects.update(comment_count=0)
+        comment.delete()
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'posts.counters.recount_post',
+                         msg='Расхождение счетчика не поставило пересчет')
+        Post.objects.update(comment_count=5)
+        jobs_queue.run(job.name, job.kwargs)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0,
+                         msg='Пересчет записи не исправил счетчик')
+
+    def test_user_delete_enqueues_nothing(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.author, author=self.user)
+        post = Post.objects.create(text='Text', author=self.user)
+        Comment.objects.create(post=post, author=self.author,
+                               text='Comment')
+        self.user.delete()
+        self.assertFalse(Job.objects.exists(),
+                         msg='Каскадное удаление поставило пересчет')
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.client.force_login(self.user)
+
+    def follow(self):
+        self.client.post(reverse('profile_follow', kwargs={
+            'username': 'author'}))
+
+    def feed(self):
+        response = self.client.get(reverse('follow_index'))
+        return [post.pk for post in response.context['page']]
+
+    def test_new_post_fans_out(self):
+        self.follow()
+        post = Post.objects.create(text='Text', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists(),
+            msg='Запись не попала в ленту подписчика')
+        self.assertEqual(self.feed(), [post.pk])
+
+    def test_follow_backfills_and_unfollow_purges(self):
+        old = Post.objects.create(text='Old', author=self.author)
+        self.follow()
+        self.assertEqual(self.feed(), [old.pk],
+                         msg='Старые записи не добавлены в ленту')
+        self.client.post(reverse('profile_unfollow', kwargs={
+            'username': 'author'}))
+        self.assertFalse(TimelineEntry.objects.exists(),
+                         msg='Лента не очищена после отписки')
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_popular_author_read_on_fetch(self):
+        self.follow()
+        post = Post.objects.create(text='Text', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists(),
+                         msg='Записи популярного автора раскладываются')
+        self.assertEqual(self.feed(), [post.pk],
+                         msg='Записи популярного автора не видны в ленте')
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_author_below_threshold_is_backfilled(self):
+        other = User.objects.create_user(username='other')
+        other.follower.create(author=self.author)
+        self.follow()
+        post = Post.objects.create(text='Text', author=self.author)
+        self.assertEqual(self.feed(), [post.pk])
+        other.follower.all().delete()
+        self.assertEqual(self.feed(), [post.pk],
+                         msg='Записи пропали, когда автор стал непопулярным')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists(),
+            msg='Записи не разложены по лентам оставшихся подписчиков')
+
+    def test_cursors_merge_entries_and_popular_authors(self):
+        popular = User.objects.create_user(username='popular')
+        self.follow()
+        self.user.follower.create(author=popular)
+        start = timezone.now()
+        for i in range(7):
+            for author in (self.author, popular):
+                post = Post.objects.create(text='Text', author=author)
+                Post.objects.filter(pk=post.pk).update(
+                    pub_date=start - timedelta(minutes=i))
+        timeline.rebuild(self.user.pk)
+        expected = list(Post.objects.order_by('-pub_date', '-pk')
+                        .values_list('pk', flat=True))
+        # Автор стал популярным: его записи остались и в ленте читателя
+        with self.settings(TIMELINE_FANOUT_THRESHOLD=0):
+            paginator = CursorPaginator(feeds.follow_feed(self.user), 4)
+            seen, cursor = [], None
+            while True:
+                page = paginator.get_page(after=cursor)
+                seen.extend(post.pk for post in page)
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+            back = paginator.get_page(before=page.previous_cursor)
+        self.assertEqual(seen, expected,
+                         msg='Курсоры ленты подписок теряют записи')
+        self.assertEqual([post.pk for post in back], expected[8:12],
+                         msg='Переход назад по ленте подписок')
+
+    def test_rebuild_command(self):
+        self.follow()
+        post = Post.objects.create(text='Text', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.feed(), [post.pk],
+                         msg='Лента не восстановлена')
+
+
+class TestPostFragments(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.posts = [Post.objects.create(text=f'Post {i}',
+                                          author=self.author)
+                      for i in range(3)]
+
+    def test_page_read_with_one_cache_call(self):
+        self.client.get(reverse('index'))
+        with mock.patch.object(fragments, 'cache',
+                               wraps=fragments.cache) as spy:
+            self.client.get(reverse('profile', kwargs={
+                'username': 'author'}))
+        self.assertEqual(spy.get_many.call_count, 1,
+                         msg='Фрагменты читаются не одним запросом')
+        spy.set_many.assert_not_called()
+
+    def test_edit_and_comment_change_key(self):
+        post = self.posts[0]
+        key = fragments.fragment_key(post)
+        post.text = 'Edited'
+        post.save()
+        self.assertNotEqual(fragments.fragment_key(post), key,
+                            msg='Правка не меняет ключ фрагмента')
+        key = fragments.fragment_key(post)
+        Comment.objects.create(post=post, author=self.user, text='Hi')
+        post.refresh_from_db()
+        self.assertNotEqual(fragments.fragment_key(post), key,
+                            msg='Комментарий не меняет ключ фрагмента')
+
+    def test_group_and_author_changes_rerender(self):
+        group = Group.objects.create(title='Старое', slug='old')
+        post = self.posts[0]
+        post.group = group
+        post.save()
+        url = reverse('index')
+        self.assertContains(self.client.get(url), '#Старое')
+        group.title = 'Новое'
+        group.save()
+        self.assertContains(self.client.get(url), '#Новое',
+                            msg_prefix='Карточка со старым сообществом')
+        group.delete()
+        self.assertNotContains(self.client.get(url), '#Новое',
+                               msg_prefix='Карточка с удаленным сообществом')
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertContains(self.client.get(url), '@renamed',
+                            msg_prefix='Карточка со старым именем автора')
+
+    def test_edit_link_not_cached(self):
+        url = reverse('profile', kwargs={'username': 'author'})
+        self.client.force_login(self.author)
+        self.assertContains(self.client.get(url), 'Редактировать')
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(url), 'Редактировать',
+                               msg_prefix='Чужая ссылка на редактирование')
+
+
+def make_image(size=(200, 100), name='image.jpg', fmt='JPEG', **save_kwargs):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, fmt, **save_kwargs)
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type=f'image/{fmt.lower()}')
+
+
+class MediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class TestRenditions(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.post = Post.objects.create(text='Text', author=self.user,
+                                        image=make_image((2000, 1500)))
+
+    def test_generate_records_renditions(self):
+        renditions.generate(self.post.pk)
+        self.post.refresh_from_db()
+        stored = self.post.renditions
+        self.assertEqual(set(stored), {'feed', 'detail', 'small'})
+        self.assertEqual((stored['feed']['width'], stored['feed']['height']),
+                         (1060, 539), msg='Неверный размер копии для ленты')
+        self.assertEqual(stored['detail']['width'], 1600)
+        storage = self.post.image.storage
+        for rendition in stored.values():
+            for path in rendition['files']:
+                self.assertTrue(storage.exists(path),
+                                msg='Файл копии не сохранен')
+        self.assertEqual(stored['feed']['srcset'].count('w,'), 2,
+                         msg='Не все ширины попали в srcset')
+        self.assertIn('image/webp',
+                      [source['type'] for source in stored['feed']['sources']],
+                      msg='Нет копии в WebP')
+
+    def test_feed_has_picture_sources(self):
+        renditions.generate(self.post.pk)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '<source type="image/webp"',
+                            msg_prefix='В ленте нет <source> для WebP')
+        self.assertContains(response, 'srcset=')
+
+    def test_generate_in_process_pool(self):
+        with ProcessPoolExecutor(1) as pool:
+            renditions.generate(self.post.pk, pool=pool)
+        self.post.refresh_from_db()
+        self.assertIn('feed', self.post.renditions,
+                      msg='Копии из пула процессов не сохранены')
+
+    def test_feed_uses_rendition(self):
+        renditions.generate(self.post.pk)
+        self.post.refresh_from_db()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, self.post.renditions['feed']['url'],
+                            msg_prefix='В ленте нет готовой копии')
+
+    def test_cleared_image_drops_renditions(self):
+        renditions.generate(self.post.pk)
+        self.post.refresh_from_db()
+        old = self.post.renditions['feed']['files'][0]
+        self.post.image = None
+        self.post.save()
+        renditions.generate(self.post.pk)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.renditions, {})
+        self.assertFalse(self.post.image.storage.exists(old),
+                         msg='Старая копия не удалена')
+
+    @override_settings(POST_IMAGE_ASYNC=True)
+    def test_replaced_image_drops_old_renditions(self):
+        renditions.generate(self.post.pk)
+        self.client.force_login(self.user)
+        self.client.post(reverse('post_edit', kwargs={
+            'username': 'bum', 'post_id': self.post.pk}),
+            {'text': 'Text', 'image': make_image((300, 200), 'new.jpg')})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.renditions, {},
+                         msg='Остались копии прежней картинки')
+        self.assertTrue(Job.objects.exists(), msg='Копии не поставлены')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, self.post.image.url,
+                            msg_prefix='В ленте нет новой картинки')
+
+    @override_settings(POST_IMAGE_ASYNC=True)
+    def test_schedule_enqueues_job(self):
+        renditions.schedule(self.post)
+        renditions.schedule(self.post)
+        job = Job.objects.get()
+        self.assertEqual(job.name, 'posts.renditions.generate')
+        self.assertEqual(job.dedup_key, f'renditions:{self.post.pk}')
+        jobs_queue.run(job.name, job.kwargs)
+        self.post.refresh_from_db()
+        self.assertIn('feed', self.post.renditions,
+                      msg='Задача не подготовила копии')
+
+    def test_backfill_command(self):
+        call_command('generate_renditions', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertIn('feed', self.post.renditions,
+                      msg='Команда не подготовила копии')
+
+
+class TestImageUpload(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.client.force_login(self.user)
+
+    def clean(self, upload):
+        form = PostForm({'text': 'Text'}, {'image': upload})
+        return form, form.is_valid()
+
+    def test_small_image_kept_size(self):
+        form, valid = self.clean(make_image((640, 480)))
+        self.assertTrue(valid, msg=form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (640, 480))
+
+    @override_settings(POST_IMAGE_MAX_SIZE=(800, 800))
+    def test_large_image_downsampled(self):
+        form, valid = self.clean(make_image((3200, 1600)))
+        self.assertTrue(valid, msg=form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (800, 400),
+                             msg='Оригинал не уменьшен')
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_decompression_bomb_rejected(self):
+        form, valid = self.clean(make_image((2000, 2000), fmt='PNG',
+                                            name='bomb.png'))
+        self.assertFalse(valid, msg='Слишком большая картинка принята')
+        self.assertIn('image', form.errors)
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_large_file_rejected(self):
+        noise = Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3))
+        buffer = BytesIO()
+        noise.save(buffer, 'PNG')
+        upload = SimpleUploadedFile('noise.png', buffer.getvalue(),
+                                    content_type='image/png')
+        form, valid = self.clean(upload)
+        self.assertFalse(valid, msg='Слишком большой файл принят')
+
+    def test_exif_stripped(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        form, valid = self.clean(make_image(exif=exif.tobytes()))
+        self.assertTrue(valid, msg=form.errors)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertFalse(image.getexif(), msg='EXIF не удален')
+
+    @override_settings(POST_IMAGE_MAX_SIZE=(300, 300))
+    def test_saved_post_keeps_normalized_image(self):
+        self.client.post(reverse('new_post'),
+                         {'text': 'Text', 'image': make_image((900, 600))})
+        post = Post.objects.get()
+        self.assertEqual((post.image.width, post.image.height), (300, 200),
+                         msg='Сохранен неуменьшенный оригинал')
+
+
+class TestQueryPlans(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.group = Group.objects.create(title='testgroup',
+                                          slug='testgroup')
+        self.post = Post.objects.create(text='Text', author=self.author,
+                                        group=self.group)
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def assertSearches(self, queryset, index, where):
+        """Запрос ищет диапазон индекса: без SCAN и без сортировки."""
+        plan = self.plan(queryset)
+        self.assertRegex(
+            plan, rf'SEARCH \w+ USING (COVERING INDEX |INDEX )?{index} '
+                  rf'\({where}\)',
+            msg=f'Запрос не ищет по {index} ({where}): {plan}')
+        self.assertNotIn('SCAN', plan,
+                         msg=f'Запрос просматривает таблицу: {plan}')
+        self.assertNotIn('TEMP B-TREE', plan,
+                         msg=f'Запрос сортирует без индекса: {plan}')
+
+    def feed_page(self, queryset, after=None):
+        page = CursorPaginator(queryset, 10).get_page(after=after)
+        return page.queryset
+
+    def test_feed_queries_use_indexes(self):
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        # Индекс поля pub_date (db_index) с именем от Django
+        self.assertSearches(self.feed_page(feeds.index_feed(), cursor),
+                            r'posts_post_pub_date_\w+', r'pub_date<\?')
+        cases = {
+            'group': (feeds.group_feed(self.group),
+                      'post_group_pub_date_idx', r'group_id=\?'),
+            'profile': (feeds.profile_feed(self.author),
+                        'post_author_pub_date_idx', r'author_id=\?'),
+        }
+        for name, (queryset, index, where) in cases.items():
+            with self.subTest(feed=name):
+                self.assertSearches(self.feed_page(queryset), index, where)
+                self.assertSearches(self.feed_page(queryset, cursor), index,
+                                    rf'{where} AND pub_date<\?')
+
+    def test_index_first_page_reads_from_newest(self):
+        # Первая страница общей ленты — единственный просмотр: индекс
+        # pub_date читается с новых записей и останавливается на LIMIT
+        plan = self.plan(self.feed_page(feeds.index_feed()))
+        self.assertRegex(plan, r'^SCAN posts_post USING INDEX '
+                               r'posts_post_pub_date_\w+ \|',
+                         msg=f'Первая страница не идет по индексу: {plan}')
+        self.assertNotIn('TEMP B-TREE', plan,
+                         msg=f'Запрос сортирует без индекса: {plan}')
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_follow_feed_uses_indexes(self):
+        # Лента подписок сливается постранично из ленты читателя и записей
+        # каждого популярного автора; каждый источник листается индексом,
+        # а записи страницы загружаются по id
+        self.user.follower.create(author=self.author)
+        indexes = [('timeline_user_pub_date_idx', r'user_id=\?'),
+                   ('post_author_pub_date_idx', r'author_id=\?')]
+        cursor = encode_cursor(self.post.pub_date, self.post.pk)
+        feed = feeds.follow_feed(self.user)
+        paginator = CursorPaginator(feed, 10)
+        sources = timeline.timeline_sources(self.user)
+        self.assertEqual(len(sources), len(indexes))
+        for after in (None, cursor):
+            page = paginator.get_page(after=after)
+            for (queryset, pk), (index, where) in zip(sources, indexes):
+                if after:
+                    where = rf'{where} AND pub_date<\?'
+                with self.subTest(index=index, after=after):
+                    keys = queryset.values_list('pub_date', pk)
+                    self.assertSearches(page.keyset(keys, pk), index, where)
+        self.assertSearches(
+            feed.queryset.filter(pk__in=[self.post.pk]).order_by(),
+            'INTEGER PRIMARY KEY', r'rowid=\?')
+
+    def test_comments_use_index(self):
+        self.assertSearches(self.post.comments.order_by('created'),
+                            'comment_post_created_idx', r'post_id=\?')
+
+    def test_follow_lookup_uses_unique_index(self):
+        follows = Follow.objects.filter(user=self.user, author=self.author)
+        self.assertSearches(follows, 'sqlite_autoindex_posts_follow_1',
+                            r'user_id=\? AND author_id=\?')
+
+    def test_follow_is_unique(self):
+        self.client.force_login(self.user)
+        for _ in range(2):
+            self.client.post(reverse('profile_follow', kwargs={
+                'username': 'author'}))
+        self.assertEqual(Follow.objects.count(), 1,
+                         msg='Повторная подписка создала дубль')
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.backend = search.get_backend()
+
+    def find(self, query, **kwargs):
+        return self.backend.search(query, **kwargs).post_ids
+
+    def test_finds_other_word_forms(self):
+        post = Post.objects.create(text='Коты спят на окнах',
+                                   author=self.user)
+        self.assertEqual(self.find('кот'), [post.pk],
+                         msg='Поиск не учитывает формы слов')
+        self.assertEqual(self.find('окном'), [post.pk])
+        self.assertEqual(self.find('собака'), [])
+
+    def test_finds_post_by_comment(self):
+        post = Post.objects.create(text='Без слов', author=self.user)
+        comment = Comment.objects.create(text='Отличная рыбалка',
+                                         author=self.user, post=post)
+        self.assertEqual(self.find('рыбалка'), [post.pk],
+                         msg='Поиск не находит запись по комментарию')
+        comment.delete()
+        self.assertEqual(self.find('рыбалка'), [],
+                         msg='Удаленный комментарий остался в индексе')
+
+    def test_index_follows_edit_and_delete(self):
+        post = Post.objects.create(text='Старый текст', author=self.user)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(self.find('старый'), [],
+                         msg='Индекс не обновился после правки')
+        self.assertEqual(self.find('новый'), [post.pk])
+        post.delete()
+        self.assertEqual(self.find('текст'), [],
+                         msg='Удаленная запись осталась в индексе')
+
+    def test_newer_post_ranks_higher(self):
+        old = Post.objects.create(text='Поход в горы', author=self.user)
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=old.pub_date - timedelta(days=90))
+        new = Post.objects.create(text='Поход в горы', author=self.user)
+        self.assertEqual(self.find('горы'), [new.pk, old.pk],
+                         msg='Свежая запись не выше старой')
+
+    def test_cursor_walks_all_results(self):
+        for i in range(25):
+            Post.objects.create(text=f'Заметка {i}', author=self.user)
+        seen = []
+        cursor = None
+        while True:
+            page = self.backend.search('заметки', cursor=cursor, limit=10)
+            seen.extend(page.post_ids)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(sorted(seen),
+                         sorted(Post.objects.values_list('pk', flat=True)),
+                         msg='Курсоры пропускают или повторяют результаты')
+
+    def test_crafted_cursor_gives_first_page(self):
+        post = Post.objects.create(text='Заметка', author=self.user)
+        for values in ([{}, 1, 2], ['x', {}, 1], [1.0, 2.0, 'x'],
+                       [1, 2, True], [1, 2], 'x'):
+            with self.subTest(cursor=values):
+                response = self.client.get(reverse('search'), {
+                    'q': 'заметка', 'after': search.encode_cursor(values)})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([p.pk for p in response.context['posts']],
+                                 [post.pk], msg='Курсор не проверяется')
+
+    def test_rebuild_command(self):
+        Post.objects.bulk_create([Post(text='Тихий вечер', author=self.user)])
+        self.assertEqual(self.find('вечер'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.find('вечер')), 1,
+                         msg='Команда не проиндексировала записи')
+
+    def test_search_view(self):
+        post = Post.objects.create(text='Пишу про котов', author=self.user)
+        response = self.client.get(reverse('search'), {'q': 'кот'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Пишу про котов')
+        self.assertEqual([p.pk for p in response.context['posts']],
+                         [post.pk])
+
+    @override_settings(
+        POSTS_SEARCH_BACKEND='posts.search.LikeSearchBackend')
+    def test_like_backend(self):
+        post = Post.objects.create(text='Рыжий кот на крыше',
+                                   author=self.user)
+        self.assertEqual(search.get_backend().search('кот').post_ids,
+                         [post.pk], msg='Не работает запасной поиск')
+
+
+class TestAdminChangelists(TestCase):
+    # Сессия, пользователь, оценка числа строк, строки страницы; у Post
+    # и Comment еще границы дат и список дней для date_hierarchy. С кэшем
+    # в памяти процесса сессия и пользователь читаются из базы
+    BUDGETS = {'post': 6, 'comment': 6, 'follow': 4}
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='password')
+        self.client.force_login(self.admin)
+        self.client.get(reverse('admin:index'))
+        self.group = Group.objects.create(title='Группа', slug='group')
+
+    def add_rows(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'author{User.objects.count()}')
+            post = Post.objects.create(text=f'Post {i}', author=author,
+                                       group=self.group)
+            Comment.objects.create(text='Comment', author=self.admin,
+                                   post=post)
+            Follow.objects.create(user=self.admin, author=author)
+
+    def queries(self, model):
+        url = reverse(f'admin:posts_{model}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_changelist_query_budget(self):
+        for rows in (3, 10):
+            self.add_rows(rows)
+            for model, budget in self.BUDGETS.items():
+                with self.subTest(model=model, rows=rows):
+                    queries = self.queries(model)
+                    self.assertEqual(len(queries), budget,
+                                     msg='Число запросов не совпадает')
+                    self.assertFalse(
+                        any(sql.startswith('SELECT COUNT(*)')
+                            for sql in queries),
+                        msg='Список считает все строки таблицы')
+
+    def test_small_tables_are_counted_exactly(self):
+        self.add_rows(2)
+        Post.objects.filter(pk=Post.objects.first().pk).delete()
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_estimate_is_clamped_to_last_page(self):
+        self.add_rows(5)
+        # Оценка по наибольшему id: 5 строк, из них есть 3, затем 2
+        Post.objects.filter(pk__in=Post.objects.order_by('pk')
+                            .values('pk')[:2]).delete()
+        paginator = EstimatedCountPaginator(Post.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.num_pages, 3)
+        page = paginator.get_page(2)
+        self.assertEqual(len(page), 1, msg='Вторая страница не последняя')
+        self.assertEqual(paginator.count, 3,
+                         msg='Неполная страница не уточнила число строк')
+        self.assertFalse(page.has_next())
+        Post.objects.order_by('pk').first().delete()
+        paginator = EstimatedCountPaginator(Post.objects.order_by('pk'), 2)
+        page = paginator.get_page(2)
+        self.assertEqual((page.number, len(page)), (1, 2),
+                         msg='Вместо пустой страницы не отдана последняя')
+        self.assertEqual(paginator.num_pages, 1)
+
+    def test_admin_search_uses_index(self):
+        self.add_rows(2)
+        post = Post.objects.create(text='Редкая запись про маяки',
+                                   author=self.admin)
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'q': 'маяк'})
+        self.assertEqual(list(response.context['cl'].result_list), [post])
+
+
+class TestTransfer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.author = User.objects.create_user(username='author')
+        self.user = User.objects.create_user(username='bum')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='Прогулка по лесу',
+                                        author=self.author, group=self.group)
+        Post.objects.filter(pk=self.post.pk).update(
+            pub_date=self.post.pub_date - timedelta(days=400))
+        Post.objects.create(text='Без сообщества', author=self.user)
+        Comment.objects.create(text='Здорово', author=self.user,
+                               post=self.post)
+        Follow.objects.create(user=self.user, author=self.author)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def snapshot(self):
+        return {
+            'posts': list(Post.objects.order_by('pk').values_list(
+                'pk', 'text', 'pub_date', 'author__username',
+                'group__slug')),
+            'comments': list(Comment.objects.order_by('pk').values_list(
+                'pk', 'post_id', 'author__username', 'text', 'created')),
+            'follows': list(Follow.objects.values_list(
+                'user__username', 'author__username')),
+        }
+
+    def round_trip(self, fmt, path):
+        before = self.snapshot()
+        call_command('export_data', path, format=fmt, batch_size=1,
+                     stdout=StringIO(), stderr=StringIO())
+        Group.objects.all().delete()
+        User.objects.exclude(username='bum').delete()
+        call_command('import_data', path, format=fmt, batch_size=2,
+                     stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self.snapshot(), before,
+                         msg='Данные изменились при выгрузке и загрузке')
+
+    def test_jsonl_round_trip(self):
+        self.round_trip('jsonl', os.path.join(self.directory, 'data.jsonl'))
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.comment_count, 1,
+                         msg='Счетчики не пересчитаны после загрузки')
+        self.assertEqual(
+            UserStats.objects.get(user=post.author).followers_count, 1)
+        self.assertEqual(search.get_backend().search('лес').post_ids,
+                         [post.pk], msg='Поисковый индекс не собран')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv', os.path.join(self.directory, 'data'))
+
+    def test_resume_skips_saved_lines(self):
+        path = os.path.join(self.directory, 'data.jsonl')
+        transfer.export_data(path)
+        Post.objects.all().delete()
+        checkpoint = transfer.Checkpoint(f'{path}.checkpoint')
+        # Сообщество и первая запись уже загружены
+        checkpoint.save('jsonl', 2)
+        transfer.import_data(path, checkpoint=checkpoint)
+        self.assertEqual(list(Post.objects.values_list('text', flat=True)),
+                         ['Без сообщества'],
+                         msg='Загрузка не продолжилась с контрольной точки')
+        self.assertFalse(os.path.exists(checkpoint.path),
+                         msg='Контрольная точка не удалена')
+
+    def test_conflicts_are_not_counted(self):
+        path = os.path.join(self.directory, 'data.jsonl')
+        transfer.export_data(path)
+        imported = transfer.import_data(path)
+        self.assertEqual(
+            [imported[model] for model in transfer.MODELS], [0, 0, 0, 0],
+            msg='Существующие строки посчитаны загруженными')
+        self.assertEqual(imported['skipped'], 5)
+
+    def test_comments_skip_posts_taken_by_others(self):
+        path = os.path.join(self.directory, 'data.jsonl')
+        transfer.export_data(path, models=('post', 'comment'))
+        Post.objects.all().delete()
+        # id записи занят чужой записью, вторая запись из файла загрузится
+        Post.objects.create(id=self.post.pk, text='Чужая', author=self.user)
+        imported = transfer.import_data(path)
+        self.assertEqual(imported['post'], 1)
+        self.assertEqual(imported['comment'], 0,
+                         msg='Комментарий попал к чужой записи')
+        self.assertFalse(Comment.objects.exists())
+
+    def test_import_rebuilds_timelines(self):
+        path = os.path.join(self.directory, 'data.jsonl')
+        transfer.export_data(path)
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        transfer.import_data(path)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.user)
+                 .values_list('post_id', flat=True)),
+            [self.post.pk], msg='Ленты подписок не собраны после загрузки')
+
+    def test_empty_csv_text(self):
+        path = os.path.join(self.directory, 'data')
+        os.makedirs(path)
+        with open(os.path.join(path, 'post.csv'), 'w') as file:
+            file.write('id,text,pub_date,author,group,image\n'
+                       '100,,2020-01-01T00:00:00+00:00,author,,\n')
+        imported = transfer.import_data(path, fmt='csv')
+        self.assertEqual(imported['post'], 1)
+        self.assertEqual(Post.objects.get(pk=100).text, '')
+
+    def test_unknown_users_are_skipped(self):
+        path = os.path.join(self.directory, 'data.jsonl')
+        transfer.export_data(path, models=('post',))
+        Post.objects.all().delete()
+        self.author.delete()
+        imported = transfer.import_data(path, create_users=False)
+        self.assertEqual(imported['post'], 1)
+        self.assertEqual(imported['skipped'], 1)
+
+
+class TestBenchmarkSeed(TestCase):
+    def test_seed_keeps_dates(self):
+        ids = seed(Dataset(users=5, groups=2, posts=20, follows_per_user=2,
+                           images=0))
+        self.assertEqual(len(ids['posts']), 20)
+        dates = Post.objects.values_list('pub_date', flat=True)
+        self.assertGreater(len(set(dates)), 1,
+                           msg='Даты записей заменены временем вставки')
+        self.assertEqual(
+            Post.objects.get(pk=ids['posts'][0]).comment_count,
+            Comment.objects.filter(post_id=ids['posts'][0]).count())
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        Post.objects.create(text='Запись', author=self.user)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('index'))
+        timing = response['Server-Timing']
+        for part in ('total;dur=', 'db;dur=', 'queries', 'cache;desc=',
+                     'tpl;dur='):
+            self.assertIn(part, timing, msg='Неполный Server-Timing')
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_cache_hits_are_counted(self):
+        self.client.get(reverse('index'))
+        timing = self.client.get(reverse('index'))['Server-Timing']
+        self.assertNotIn('hit=0', timing,
+                         msg='Попадания в кэш не учитываются')
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_only_for_staff(self):
+        self.assertFalse(self.client.get(reverse('index'))
+                         .has_header('Server-Timing'),
+                         msg='Server-Timing отдается всем')
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertTrue(self.client.get(reverse('index'))
+                        .has_header('Server-Timing'))
+
+    @override_settings(METRICS_SERVER_TIMING=False, METRICS_TOKEN='secret')
+    def test_server_timing_does_not_load_user(self):
+        load_user = mock.Mock(return_value=self.user)
+
+        def get_response(request):
+            request.user = SimpleLazyObject(load_user)
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(get_response)
+        factory = RequestFactory()
+        self.assertFalse(middleware(factory.get('/'))
+                         .has_header('Server-Timing'))
+        self.assertTrue(middleware(factory.get(
+            '/', HTTP_AUTHORIZATION='Bearer secret'))
+            .has_header('Server-Timing'))
+        load_user.assert_not_called()
+        request = factory.get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = 'key'
+        middleware(request)
+        load_user.assert_called_once_with()
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_prometheus_endpoint(self):
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        text = response.content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      text)
+        self.assertIn('yatube_request_duration_seconds_count{view="index"} 1',
+                      text)
+        self.assertIn('yatube_db_queries_bucket{view="index",le="+Inf"} 1',
+                      text)
+        self.assertIn('yatube_cache_misses_total{view="index"}', text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_needs_token_or_staff(self):
+        for headers in ({'REMOTE_ADDR': '127.0.0.1'},
+                        {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                response = self.client.get(reverse('metrics'), **headers)
+                self.assertEqual(response.status_code, 404,
+                                 msg='Метрики доступны без токена')
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                         200, msg='Метрики недоступны сотруднику')
+
+
+class TestQueryCheck(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.post = Post.objects.create(text='Запись', author=self.author)
+
+    def test_shape_ignores_values(self):
+        self.assertEqual(
+            shape('SELECT * FROM t WHERE id IN (%s, %s) AND name = \'a\''),
+            shape('SELECT * FROM t WHERE id IN (%s)  AND name = \'b\''))
+        self.assertNotEqual(shape('SELECT a FROM t'),
+                            shape('SELECT b FROM t'))
+
+    def test_budget_fails_when_exceeded(self):
+        with self.assertRaisesRegex(AssertionError, 'Запросов 2, бюджет 1'):
+            with query_budget(1):
+                list(User.objects.all())
+                list(Post.objects.all())
+
+    def test_budget_finds_repeated_queries(self):
+        with self.assertRaisesRegex(AssertionError, 'N\\+1'):
+            with query_budget(100, repeat_threshold=3):
+                for _ in range(3):
+                    Post.objects.get(pk=self.post.pk)
+
+    def test_post_view_has_no_per_comment_queries(self):
+        for i in range(10):
+            commenter = User.objects.create_user(username=f'user{i}')
+            self.post.comments.create(author=commenter, text='Comment')
+        with query_budget(4, repeat_threshold=2):
+            response = self.client.get(reverse('post_view', kwargs={
+                'username': 'author', 'post_id': self.post.pk}))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERYCHECK_SLOW_QUERY_MS=0,
+                       QUERYCHECK_SAMPLE_RATE=1,
+                       QUERYCHECK_REPEAT_THRESHOLD=1)
+    def test_middleware_logs_with_view_name(self):
+        with self.assertLogs('yatube.querycheck', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+        output = '\n'.join(logs.output)
+        self.assertIn('Медленный запрос в index', output)
+        self.assertIn('Возможный N+1 в index', output)
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.post = Post.objects.create(text='Запись', author=self.author)
+        for i in range(12):
+            self.post.comments.create(author=self.author, text=f'Comment {i}')
+        self.url = reverse('post_view', kwargs={'username': 'author',
+                                                'post_id': self.post.pk})
+        self.comments_url = reverse('post_comments', kwargs={
+            'username': 'author', 'post_id': self.post.pk})
+
+    def walk(self, url, **params):
+        texts = []
+        while True:
+            data = self.client.get(url, dict(params, format='json')).json()
+            texts.extend(comment['text'] for comment in data['comments'])
+            if not data['next']:
+                return texts
+            params['after'] = data['next']
+
+    def test_pages_cover_thread_in_both_orders(self):
+        oldest = [f'Comment {i}' for i in range(12)]
+        self.assertEqual(self.walk(self.comments_url, order='oldest'),
+                         oldest, msg='Курсоры теряют комментарии')
+        self.assertEqual(self.walk(self.comments_url, order='newest'),
+                         oldest[::-1], msg='Неверный порядок новых')
+
+    def test_post_view_shows_first_page(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Comment 4')
+        self.assertNotContains(response, 'Comment 5')
+        page = response.context['comments']
+        next_page = self.client.get(self.url, {'after': page.next_cursor})
+        self.assertContains(next_page, 'Comment 5')
+
+    def test_html_fragment(self):
+        response = self.client.get(self.comments_url, {'order': 'newest'})
+        self.assertTemplateUsed(response, 'comment_list.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertContains(response, 'Comment 11')
+
+    def test_cached_page_is_invalidated_by_new_comment(self):
+        self.client.get(self.url, {'order': 'newest'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'order': 'newest'})
+        self.assertFalse(
+            any('FROM "posts_comment"' in query['sql'] for query in queries),
+            msg='Страница комментариев не берется из кэша')
+        self.client.force_login(self.author)
+        self.client.post(reverse('add_comment', kwargs={
+            'username': 'author', 'post_id': self.post.pk}),
+            {'text': 'Свежий комментарий'})
+        response = self.client.get(self.url, {'order': 'newest'})
+        self.assertContains(response, 'Свежий комментарий',
+                            msg_prefix='Кэш не сброшен после комментария')
+
+    def test_invalid_cursors_share_first_page(self):
+        def fragments():
+            return [key for key in cache._cache
+                    if 'template.cache.comments_page' in key
+                    or 'template.cache.comments_json' in key]
+
+        self.client.get(self.comments_url)
+        self.client.get(self.comments_url, {'format': 'json'})
+        for value in ('x', 'y', 'z'):
+            self.client.get(self.comments_url, {'after': value})
+            self.client.get(self.comments_url, {'before': value,
+                                                'format': 'json'})
+        self.assertEqual(len(fragments()), 2,
+                         msg='Битые курсоры попадают в ключи кэша')
+
+
+class TestApi(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        for i in range(12):
+            self.post = Post.objects.create(text=f'Post {i}',
+                                            author=self.author,
+                                            group=self.group)
+        self.post.comments.create(author=self.user, text='Comment')
+
+    def test_feeds(self):
+        urls = [reverse('api_index'),
+                reverse('api_group_posts', kwargs={'slug': 'group'}),
+                reverse('api_profile', kwargs={'username': 'author'})]
+        for url in urls:
+            with self.subTest(url=url):
+                # id сообщества или автора и одна страница записей
+                with query_budget(2):
+                    data = self.client.get(url).json()
+                self.assertEqual(len(data['results']), 10)
+                first = data['results'][0]
+                self.assertEqual(first['text'], 'Post 11')
+                self.assertEqual(first['author'], 'author')
+                self.assertEqual(first['group'], 'group')
+                self.assertEqual(first['comment_count'], 1)
+                rest = self.client.get(url, {'after': data['next']}).json()
+                self.assertEqual(len(rest['results']), 2)
+                self.assertIsNone(rest['next'])
+
+    def test_follow_feed(self):
+        url = reverse('api_follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.user.follower.create(author=self.author)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_post_with_comments(self):
+        data = self.client.get(reverse('api_post', kwargs={
+            'post_id': self.post.pk})).json()
+        self.assertEqual(data['post']['text'], 'Post 11')
+        self.assertEqual([c['text'] for c in data['comments']['results']],
+                         ['Comment'])
+
+    def test_unchanged_feed_is_not_modified(self):
+        url = reverse('api_index')
+        etag = self.client.get(url)['ETag']
+        with query_budget(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.post.comments.create(author=self.user, text='Еще')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200,
+                         msg='Новый комментарий не меняет ETag')
+
+    def test_etag_depends_on_page(self):
+        url = reverse('api_index')
+        first = self.client.get(url)
+        second = self.client.get(url, {'after': first.json()['next']})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+
+class TestConditionalPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='Post', author=self.author,
+                                        group=self.group)
+        self.urls = {
+            'index': reverse('index'),
+            'group': reverse('group_posts', args=[self.group.slug]),
+            'profile': reverse('profile', args=[self.author.username]),
+            'post_view': reverse('post_view', args=[self.author.username,
+                                                    self.post.pk]),
+        }
+
+    def test_anonymous_pages_are_validated(self):
+        for name, url in self.urls.items():
+            response = self.client.get(url)
+            self.assertIn('ETag', response, msg=name)
+            self.assertIn('public', response['Cache-Control'], msg=name)
+            self.assertIn('Cookie', response['Vary'], msg=name)
+            with query_budget(2):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304, msg=name)
+
+    def test_changes_refresh_etag(self):
+        etags = {name: self.client.get(url)['ETag']
+                 for name, url in self.urls.items()}
+        self.post.comments.create(author=self.user, text='Comment')
+        response = self.client.get(self.urls['post_view'],
+                                   HTTP_IF_NONE_MATCH=etags['post_view'])
+        self.assertEqual(response.status_code, 200,
+                         msg='Новый комментарий не меняет ETag записи')
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(self.urls['profile'],
+                                   HTTP_IF_NONE_MATCH=etags['profile'])
+        self.assertEqual(response.status_code, 200,
+                         msg='Новый подписчик не меняет ETag профиля')
+        Post.objects.create(text='New', author=self.author, group=self.group)
+        for name in ('index', 'group'):
+            response = self.client.get(self.urls[name],
+                                       HTTP_IF_NONE_MATCH=etags[name])
+            self.assertEqual(response.status_code, 200,
+                             msg=f'Новая запись не меняет ETag {name}')
+
+    def test_last_modified_after_its_second(self):
+        second = versions.now() // 1_000_000 + 100
+        url = self.urls['index']
+
+        def at(microseconds):
+            return mock.patch.object(
+                versions, 'now',
+                return_value=second * 1_000_000 + microseconds)
+
+        with at(200_000):
+            versions.bump(versions.ALL, ('index',))
+            response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response,
+                         msg='Last-Modified до конца секунды изменения')
+        with at(700_000):
+            versions.bump(('index',))
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=http_date(second))
+        self.assertEqual(response.status_code, 200,
+                         msg='Второе изменение за секунду дало 304')
+        with at(1_500_000):
+            response = self.client.get(url)
+            self.assertEqual(response['Last-Modified'], http_date(second))
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_group_edit_refreshes_etag(self):
+        etag = self.client.get(self.urls['group'])['ETag']
+        self.group.description = 'Новое описание'
+        self.group.save()
+        response = self.client.get(self.urls['group'],
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новое описание',
+                            msg_prefix='Правка сообщества не меняет ETag')
+
+    def test_logged_in_pages_are_private(self):
+        self.client.login(username='bum', password='password')
+        for name, url in self.urls.items():
+            response = self.client.get(url)
+            self.assertNotIn('ETag', response, msg=name)
+            self.assertIn('private', response['Cache-Control'], msg=name)
+            self.assertIn('Cookie', response['Vary'], msg=name)
+
+    def test_missing_pages_are_not_cached(self):
+        response = self.client.get(reverse('group_posts', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class TestSqliteBackend(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings_dict = dict(connection.settings_dict,
+                             NAME=os.path.join(self.tmp, 'db.sqlite3'))
+        backend = type(connections['default'])
+        self.db = backend(settings_dict, alias='backend_test')
+        self.addCleanup(self.db.close)
+
+    def pragma(self, name):
+        with self.db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    def test_replaced_database_is_reopened(self):
+        self.pragma('journal_mode')
+        old = self.db.connection
+        self.db.close_if_unusable_or_obsolete()
+        self.assertIs(self.db.connection, old,
+                      msg='Соединение не переиспользуется между запросами')
+        os.replace(self.db.settings_dict['NAME'],
+                   os.path.join(self.tmp, 'old.sqlite3'))
+        self.pragma('journal_mode')
+        self.assertIsNot(self.db.connection, old,
+                         msg='Подмена файла базы не замечена')
+
+
+class TestReplicaRouting(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.post = Post.objects.create(text='Post', author=self.user)
+        self.router = routers.PrimaryReplicaRouter()
+
+    def test_replicate_copies_and_marks_replica(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        primary = os.path.join(tmp, 'primary.sqlite3')
+        replica = os.path.join(tmp, 'replica.sqlite3')
+        with sqlite3.connect(primary) as db:
+            db.execute('CREATE TABLE t (x)')
+            db.execute('INSERT INTO t VALUES (1)')
+        self.assertFalse(routers.is_synced(primary, replica))
+        # Запись в прошлом, чтобы не зависеть от грубых часов ФС
+        past = os.stat(primary).st_mtime - 10
+        os.utime(primary, (past, past))
+        routers.replicate(primary, replica)
+        with sqlite3.connect(replica) as db:
+            self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(1,)])
+        self.assertTrue(routers.is_synced(primary, replica))
+        with sqlite3.connect(primary) as db:
+            db.execute('INSERT INTO t VALUES (2)')
+        self.assertFalse(routers.is_synced(primary, replica),
+                         msg='Запись после копии не делает реплику отставшей')
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Post), DEFAULT_DB_ALIAS)
+        with routers.replica():
+            self.assertEqual(self.router.db_for_read(Post), 'replica')
+            self.assertEqual(self.router.db_for_read(Session),
+                             DEFAULT_DB_ALIAS)
+            self.assertEqual(self.router.db_for_write(Post),
+                             DEFAULT_DB_ALIAS)
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+
+    def test_replica_reads_only_fresh_and_not_sticky(self):
+        view = routers.replica_reads(
+            lambda request: HttpResponse(str(routers.reading_replica())))
+        factory = RequestFactory()
+        self.assertEqual(view(factory.get('/')).content, b'False',
+                         msg='В тестах реплика-зеркало не должна читаться')
+        with mock.patch('yatube.routers.replica_is_fresh',
+                        return_value=True):
+            self.assertEqual(view(factory.get('/')).content, b'True')
+            request = factory.get('/')
+            request.COOKIES[settings.REPLICA_STICKY_COOKIE] = '1'
+            self.assertEqual(view(request).content, b'False')
+
+    def test_writes_set_sticky_cookie(self):
+        self.client.login(username='bum', password='password')
+        response = self.client.get(reverse('new_post'))
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        response = self.client.post(
+            reverse('add_comment', args=['bum', self.post.pk]),
+            {'text': 'Comment'})
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+
+class InlineExecutor(Executor):
+    """Выполняет в текущем потоке: тестовая транзакция видна запросу."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class TestASGIHandler(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        Post.objects.create(text='Запись через ASGI', author=self.user)
+        self.handler = ASGIHandler(threads=1)
+        self.handler.executor = InlineExecutor()
+
+    def call(self, scope, messages):
+        messages = list(messages)
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(self.handler(scope, receive, send))
+        return sent
+
+    def test_http_request(self):
+        sent = self.call({
+            'type': 'http', 'method': 'GET', 'path': '/',
+            'query_string': b'', 'headers': [(b'host', b'testserver')],
+        }, [{'type': 'http.request', 'body': b''}])
+        start, body = sent
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/html; charset=utf-8'),
+                      start['headers'])
+        self.assertIn('Запись через ASGI', body['body'].decode())
+
+    def test_environ(self):
+        body = BytesIO(b'text=1')
+        environ = environ_for({
+            'type': 'http', 'method': 'POST', 'path': '/группа/',
+            'query_string': b'a=1', 'client': ('10.0.0.1', 5000),
+            'headers': [(b'content-type', b'text/plain'),
+                        (b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                        (b'x-forwarded-for', b'1.1.1.1')],
+        }, body)
+        self.assertEqual(environ['PATH_INFO'],
+                         '/группа/'.encode().decode('latin-1'))
+        self.assertEqual(environ['QUERY_STRING'], 'a=1')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(environ['HTTP_X_FORWARDED_FOR'], '1.1.1.1')
+        self.assertEqual(environ['REMOTE_ADDR'], '10.0.0.1')
+        self.assertIs(environ['wsgi.input'], body)
+
+    def test_lifespan(self):
+        sent = self.call({'type': 'lifespan'}, [
+            {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        self.assertEqual([message['type'] for message in sent],
+                         ['lifespan.startup.complete',
+                          'lifespan.shutdown.complete'])
@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+
+def _is_fanout_author(author_id):
+    """Раскладывать ли записи автора по лентам при публикации.
+
+    Записи популярных авторов читаются из ленты напрямую, поэтому их
+    не нужно копировать каждому подписчику.
+    """
+    return not UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).exists()
+
+
+def _in_batches(values, make_entry, batch_size=None):
+    batch_size = batch_size or settings.TIMELINE_BATCH_SIZE
+    batch = []
+    for value in values:
+        batch.append(make_entry(value))
+        if len(batch) >= batch_size:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    if not _is_fanout_author(post.author_id):
+        return
+    followers = (Follow.objects
+                 .filter(author_id=post.author_id)
+                 .values_list('user_id', flat=True))
+    _in_batches(followers.iterator(),
+                lambda user_id: TimelineEntry(user_id=user_id, post=post,
+                                              pub_date=post.pub_date))
+
+
+def backfill(user_id, author_id, batch_size=None):
+    if not _is_fanout_author(author_id):
+        return
+    posts = (Post.objects
+             .filter(author_id=author_id)
+             .order_by()
+             .values_list('pk', 'pub_date'))
+    _in_batches(posts.iterator(),
+                lambda post: TimelineEntry(user_id=user_id, post_id=post[0],
+                                           pub_date=post[1]),
+                batch_size)
+
+
+def purge(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 post__author_id=author_id).delete()
+
+
+def unfollowed(user_id, author_id):
+    """Чистит ленту отписавшегося и раскладывает записи автора, если тот
+    перестал быть популярным.
+
+    Пока подписчиков было больше порога, записи автора не раскладывались
+    и новым подписчикам не добавлялись, а читались напрямую. Когда
+    подписчиков становится ровно TIMELINE_FANOUT_THRESHOLD, автор уходит
+    из этого чтения, поэтому его записи раскладываются оставшимся.
+    """
+    purge(user_id, author_id)
+    followers = (UserStats.objects
+                 .filter(user_id=author_id)
+                 .values_list('followers_count', flat=True)
+                 .first())
+    if followers == settings.TIMELINE_FANOUT_THRESHOLD:
+        fill_author(author_id)
+
+
+def fill_author(author_id, batch_size=None):
+    """Раскладывает записи автора по лентам всех его подписчиков."""
+    followers = (Follow.objects
+                 .filter(author_id=author_id)
+                 .values_list('user_id', flat=True))
+    for user_id in followers.iterator():
+        backfill(user_id, author_id, batch_size)
+
+
+def rebuild(user_id=None, batch_size=None):
+    """Заново раскладывает записи по лентам из таблиц Follow и Post."""
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.order_by('pk')
+    if user_id is not None:
+        entries = entries.filter(user_id=user_id)
+        follows = follows.filter(user_id=user_id)
+    entries.delete()
+    rebuilt = 0
+    for follow in follows.iterator():
+        backfill(follow.user_id, follow.author_id, batch_size)
+        rebuilt += 1
+    return rebuilt
+
+
+def _popular(user):
+    return (Follow.objects
+            .filter(user=user,
+                    author__stats__followers_count__gt=(
+                        settings.TIMELINE_FANOUT_THRESHOLD))
+            .values('author'))
+
+
+def timeline_filter(user):
+    """Условие на записи ленты подписок пользователя.
+
+    Разложенные при публикации записи берутся из TimelineEntry, а записи
+    популярных авторов — напрямую по подпискам. Запрос с этим условием
+    сортирует всю ленту, поэтому оно нужно только навигации по номерам
+    страниц; курсоры листают timeline_sources.
+    """
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    return Q(pk__in=entries) | Q(author__in=_popular(user))
+
+
+def timeline_sources(user):
+    """Источники ключей (pub_date, id записи) ленты для MergedFeed.
+
+    Ленту читателя отдает индекс timeline_user_pub_date_idx, записи
+    каждого популярного автора — post_author_pub_date_idx.
+    """
+    sources = [(TimelineEntry.objects.filter(user=user), 'post_id')]
+    for author_id in _popular(user).values_list('author', flat=True):
+        sources.append((Post.objects.filter(author_id=author_id), 'pk'))
+    return sources
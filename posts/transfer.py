@@ -0,0 +1,388 @@
+"""Выгрузка и загрузка сообществ, записей, комментариев и подписок.
+
+Данные читаются и пишутся порциями по первичному ключу, поэтому память не
+растет с размером таблиц. Форматы: JSON Lines (все модели в одном файле,
+у каждой строки есть поле model) и CSV (по файлу на модель в каталоге).
+Пользователи передаются по username, сообщества — по slug, записи и
+комментарии сохраняют свои id. Комментарий не загружается, если id его
+записи в базе занят другой записью: строка с тем же id, автором и датой
+считается той же записью.
+
+После каждой записанной порции сохраняется контрольная точка, и прерванную
+выгрузку или загрузку можно продолжить с нее.
+"""
+import csv
+import json
+import os
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from . import search, timeline, versions
+from .counters import recount
+from .models import Comment, Follow, Group, Post, User
+
+# Порядок важен: записи ссылаются на сообщества, комментарии — на записи
+MODELS = ('group', 'post', 'comment', 'follow')
+
+FIELDS = {
+    'group': {'id': 'id', 'title': 'title', 'slug': 'slug',
+              'description': 'description'},
+    'post': {'id': 'id', 'text': 'text', 'pub_date': 'pub_date',
+             'author': 'author__username', 'group': 'group__slug',
+             'image': 'image'},
+    'comment': {'id': 'id', 'post': 'post_id',
+                'author': 'author__username', 'text': 'text',
+                'created': 'created'},
+    'follow': {'id': 'id', 'user': 'user__username',
+               'author': 'author__username'},
+}
+
+MODEL_CLASSES = {'group': Group, 'post': Post, 'comment': Comment,
+                 'follow': Follow}
+
+
+class Checkpoint:
+    """Прогресс в JSON-файле: {источник: последняя записанная позиция}."""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.state = {}
+        if resume and os.path.exists(path):
+            with open(path) as file:
+                self.state = json.load(file)
+
+    def get(self, key, default=0):
+        return self.state.get(key, default)
+
+    def save(self, key, value):
+        self.state[key] = value
+        temp = f'{self.path}.tmp'
+        with open(temp, 'w') as file:
+            json.dump(self.state, file)
+        os.replace(temp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _serialize(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_batches(model, batch_size, after=0):
+    """Порции строк модели в порядке id, начиная после id ``after``."""
+    fields = FIELDS[model]
+    queryset = MODEL_CLASSES[model].objects.order_by('pk')
+    while True:
+        rows = list(queryset.filter(pk__gt=after)
+                    .values_list(*fields.values())[:batch_size])
+        if not rows:
+            return
+        yield [{name: _serialize(value)
+                for name, value in zip(fields, row)} for row in rows]
+        after = rows[-1][0]
+
+
+class JsonLinesWriter:
+    def __init__(self, path, append=False):
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write(self, model, rows):
+        for row in rows:
+            self.file.write(json.dumps({'model': model, **row},
+                                       ensure_ascii=False))
+            self.file.write('\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    def __init__(self, path, append=False):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.append = append
+        self.writers = {}
+        self.files = []
+
+    def _writer(self, model):
+        if model not in self.writers:
+            path = os.path.join(self.path, f'{model}.csv')
+            append = self.append and os.path.exists(path)
+            file = open(path, 'a' if append else 'w', encoding='utf-8',
+                        newline='')
+            self.files.append(file)
+            writer = csv.DictWriter(file, fieldnames=list(FIELDS[model]))
+            if not append:
+                writer.writeheader()
+            self.writers[model] = (writer, file)
+        return self.writers[model]
+
+    def write(self, model, rows):
+        writer, file = self._writer(model)
+        writer.writerows({name: '' if value is None else value
+                          for name, value in row.items()} for row in rows)
+        file.flush()
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+
+WRITERS = {'jsonl': JsonLinesWriter, 'csv': CsvWriter}
+
+
+def export_data(path, fmt='jsonl', models=MODELS, batch_size=1000,
+                checkpoint=None, progress=None):
+    """Выгружает модели в файл (jsonl) или каталог (csv)."""
+    checkpoint = checkpoint or Checkpoint(f'{path}.checkpoint')
+    writer = WRITERS[fmt](path, append=bool(checkpoint.state))
+    exported = dict.fromkeys(models, 0)
+    try:
+        for model in MODELS:
+            if model not in models:
+                continue
+            for rows in export_batches(model, batch_size,
+                                       after=checkpoint.get(model)):
+                writer.write(model, rows)
+                checkpoint.save(model, rows[-1]['id'])
+                exported[model] += len(rows)
+                if progress:
+                    progress(model, exported[model])
+    finally:
+        writer.close()
+    checkpoint.clear()
+    return exported
+
+
+def read_jsonl(path):
+    """Записи файла как (источник, номер строки, модель, данные)."""
+    with open(path, encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            if line.strip():
+                record = json.loads(line)
+                yield 'jsonl', line_number, record.pop('model'), record
+
+
+def read_csv(path):
+    for model in MODELS:
+        filename = os.path.join(path, f'{model}.csv')
+        if not os.path.exists(filename):
+            continue
+        with open(filename, encoding='utf-8', newline='') as file:
+            for line_number, record in enumerate(csv.DictReader(file),
+                                                 start=1):
+                yield model, line_number, model, {
+                    name: value if value != '' else None
+                    for name, value in record.items()}
+
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv}
+
+
+# Поля auto_now_add: bulk_create заменяет их текущим временем, поэтому даты
+# из файла записываются отдельным UPDATE после вставки
+DATE_FIELDS = {'post': 'pub_date', 'comment': 'created'}
+
+
+def _key(obj):
+    if isinstance(obj, Follow):
+        return obj.user_id, obj.author_id
+    return obj.pk
+
+
+def _existing(model, objects):
+    """Ключи объектов, строки которых уже есть в базе."""
+    if model == 'follow':
+        rows = Follow.objects.filter(
+            user_id__in={obj.user_id for obj in objects},
+            author_id__in={obj.author_id for obj in objects},
+        ).values_list('user_id', 'author_id')
+        return {_key(obj) for obj in objects} & set(rows)
+    return set(MODEL_CLASSES[model].objects
+               .filter(pk__in=[obj.pk for obj in objects])
+               .values_list('pk', flat=True))
+
+
+def _insert(model, objects, batch_size):
+    """Вставляет новые объекты и возвращает их число.
+
+    Строки с уже существующими ключами пропускаются (ignore_conflicts) и
+    не считаются.
+    """
+    date_field = DATE_FIELDS.get(model)
+    if date_field:
+        dates = {obj.pk: getattr(obj, date_field) for obj in objects}
+    before = _existing(model, objects)
+    MODEL_CLASSES[model].objects.bulk_create(
+        objects, batch_size=batch_size, ignore_conflicts=True)
+    new = _existing(model, objects) - before
+    inserted = [obj for obj in objects if _key(obj) in new]
+    if date_field and inserted:
+        for obj in inserted:
+            setattr(obj, date_field, dates[obj.pk])
+        MODEL_CLASSES[model].objects.bulk_update(
+            inserted, [date_field], batch_size=batch_size)
+    return len(inserted)
+
+
+def _ids(model, field, values):
+    return dict(model.objects.filter(**{f'{field}__in': set(values)})
+                .values_list(field, 'pk'))
+
+
+def _user_ids(usernames, create_users):
+    users = _ids(User, 'username', usernames)
+    missing = set(usernames) - set(users)
+    if missing and create_users:
+        User.objects.bulk_create(
+            [User(username=username, password=make_password(None))
+             for username in missing],
+            ignore_conflicts=True)
+        users = _ids(User, 'username', usernames)
+    return users
+
+
+def _build_groups(records, create_users):
+    return [Group(id=int(record['id']), title=record['title'] or '',
+                  slug=record['slug'],
+                  description=record.get('description') or '')
+            for record in records]
+
+
+def _build_posts(records, create_users):
+    users = _user_ids([record['author'] for record in records], create_users)
+    groups = _ids(Group, 'slug',
+                  [record['group'] for record in records if record['group']])
+    return [Post(id=int(record['id']), text=record['text'] or '',
+                 pub_date=parse_datetime(record['pub_date']),
+                 author_id=users[record['author']],
+                 group_id=groups.get(record['group']),
+                 image=record.get('image') or None)
+            for record in records if record['author'] in users]
+
+
+def _build_comments(records, create_users):
+    users = _user_ids([record['author'] for record in records], create_users)
+    posts = set(Post.objects.filter(
+        pk__in={int(record['post']) for record in records})
+        .values_list('pk', flat=True))
+    return [Comment(id=int(record['id']), post_id=int(record['post']),
+                    author_id=users[record['author']],
+                    text=record['text'] or '',
+                    created=parse_datetime(record['created']))
+            for record in records
+            if record['author'] in users and int(record['post']) in posts]
+
+
+def _foreign_posts(records, objects):
+    """id записей файла, которые в базе заняты другими записями.
+
+    Сюда же попадают записи, не загруженные из-за неизвестного автора:
+    строка с их id в базе не может быть той же записью.
+    """
+    built = {obj.pk: (obj.author_id, obj.pub_date) for obj in objects}
+    ids = {int(record['id']) for record in records}
+    rows = Post.objects.filter(pk__in=ids).values_list(
+        'pk', 'author_id', 'pub_date')
+    return {pk for pk, author_id, pub_date in rows
+            if built.get(pk) != (author_id, pub_date)}
+
+
+def _build_follows(records, create_users):
+    users = _user_ids([record[field] for record in records
+                       for field in ('user', 'author')], create_users)
+    return [Follow(user_id=users[record['user']],
+                   author_id=users[record['author']])
+            for record in records
+            if record['user'] in users and record['author'] in users]
+
+
+BUILDERS = {'group': _build_groups, 'post': _build_posts,
+            'comment': _build_comments, 'follow': _build_follows}
+
+
+def import_data(path, fmt='jsonl', batch_size=1000, checkpoint=None,
+                create_users=True, progress=None, skip_rebuild=False):
+    """Загружает данные порциями, каждая в своей транзакции.
+
+    Строки с уже существующими ключами пропускаются, поэтому повторная
+    загрузка того же файла безопасна. Они, как и строки, для которых не
+    нашлись автор или запись, считаются в ``skipped``.
+    Сигналы при загрузке не вызываются, поэтому после нее счетчики, ленты
+    подписок и поисковый индекс пересобираются (см. rebuild()). С
+    ``skip_rebuild=True`` это нужно сделать самому.
+    """
+    checkpoint = checkpoint or Checkpoint(f'{path}.checkpoint')
+    # id записей, занятые в базе другими записями, хранятся в контрольной
+    # точке: комментарии к ним могут прийти после перезапуска
+    conflicts = set(checkpoint.get('conflicts', []))
+    imported = {model: 0 for model in MODELS}
+    imported['skipped'] = 0
+    pending = {'model': None, 'records': [], 'position': None}
+
+    def flush():
+        model, records = pending['model'], pending['records']
+        if not records:
+            return
+        with transaction.atomic():
+            objects = BUILDERS[model](records, create_users)
+            if model == 'comment':
+                objects = [obj for obj in objects
+                           if obj.post_id not in conflicts]
+            inserted = _insert(model, objects, batch_size)
+            if model == 'post':
+                conflicts.update(_foreign_posts(records, objects))
+        if model == 'post':
+            checkpoint.save('conflicts', sorted(conflicts))
+        checkpoint.save(*pending['position'])
+        imported[model] += inserted
+        imported['skipped'] += len(records) - inserted
+        pending['records'] = []
+        if progress:
+            progress(model, imported[model])
+
+    for source, line_number, model, record in READERS[fmt](path):
+        if line_number <= checkpoint.get(source):
+            continue
+        if model != pending['model'] or len(pending['records']) >= batch_size:
+            flush()
+            pending['model'] = model
+        pending['records'].append(record)
+        pending['position'] = (source, line_number)
+    flush()
+    _reset_sequences()
+    checkpoint.clear()
+    if not skip_rebuild:
+        rebuild(batch_size=batch_size)
+    return imported
+
+
+def rebuild(batch_size=1000, log=None):
+    """Пересобирает то, что при работе обновляют сигналы."""
+    steps = (
+        ('Пересчет счетчиков', recount),
+        ('Сборка лент подписок', timeline.rebuild),
+        ('Сборка поискового индекса', search.get_backend().rebuild),
+    )
+    for message, step in steps:
+        if log:
+            log(message)
+        step(batch_size=batch_size)
+    versions.bump(versions.ALL)
+
+
+def _reset_sequences():
+    """Сдвигает счетчики id после вставки строк с готовыми id."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), list(MODEL_CLASSES.values()))
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
@@ -1,13 +1,22 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('', views.index, name='index'),
     path('new/', views.new_post, name='new_post'),
+    path('search/', views.search_posts, name='search'),
 
     path('follow/', views.follow_index, name='follow_index'),
+
+    path('api/posts/', api.index, name='api_index'),
+    path('api/posts/<int:post_id>/', api.post_view, name='api_post'),
+    path('api/groups/<slug:slug>/posts/', api.group_posts,
+         name='api_group_posts'),
+    path('api/users/<username>/posts/', api.profile, name='api_profile'),
+    path('api/follow/posts/', api.follow_index, name='api_follow_index'),
+
     path('<username>/follow/', views.profile_follow, name='profile_follow'),
     path('<username>/unfollow/', views.profile_unfollow,
          name='profile_unfollow'),
@@ -16,5 +25,7 @@ urlpatterns = [
     path('<username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('<username>/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
+    path('<username>/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path('<username>/', views.profile, name='profile'),
 ]
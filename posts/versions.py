@@ -0,0 +1,85 @@
+"""Версии лент для ключей кэша.
+
+Каждая лента (вся лента, сообщество, автор, подписки пользователя,
+комментарии записи) и счетчики подписок в карточке автора имеют версию
+в кэше. Сигналы моделей меняют версию
+при изменении данных, поэтому фрагменты шаблонов с версией в ключе можно
+хранить долго и не бояться устаревания. Версия меняется после фиксации
+транзакции: иначе читатель мог бы собрать страницу из данных до фиксации
+и сохранить ее под новой версией. Версией служит время изменения в
+микросекундах: даже если ключ вытеснен из кэша, новая версия не совпадет
+ни с одной прежней.
+
+Версия ALL входит в каждый ключ: ее меняют массовые операции в обход
+сигналов, например импорт данных, и изменения, видные во всех лентах:
+переименование сообщества или автора, удаление сообщества.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from yatube.caches import versioned_timeout
+
+from .follows import following_ids
+
+ALL = ('all',)
+
+
+def _key(scope):
+    return 'feed-version:' + ':'.join(str(part) for part in scope)
+
+
+def now():
+    return int(time.time() * 1_000_000)
+
+
+def _timeout():
+    return versioned_timeout(settings.FEED_VERSION_TIMEOUT)
+
+
+def _set(scopes):
+    version = now()
+    cache.set_many({_key(scope): version for scope in scopes}, _timeout())
+
+
+def bump(*scopes):
+    transaction.on_commit(lambda: _set(scopes))
+
+
+def get_versions(*scopes):
+    keys = [_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = now()
+            cache.add(key, version, _timeout())
+            versions[key] = cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def feed_key(*scopes):
+    return '-'.join(str(version) for version in get_versions(ALL, *scopes))
+
+
+def follow_scopes(user):
+    return [('follow', user.pk),
+            *(('author', author_id)
+              for author_id in sorted(following_ids(user)))]
+
+
+def follow_key(user):
+    return feed_key(*follow_scopes(user))
+
+
+def post_scopes(author_id, group_id):
+    scopes = [('index',), ('author', author_id)]
+    if group_id is not None:
+        scopes.append(('group', group_id))
+    return scopes
+
+
+def stats_scopes(follow):
+    """Карточки обоих участников подписки: меняются их счетчики."""
+    return [('stats', follow.user_id), ('stats', follow.author_id)]
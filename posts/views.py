@@ -1,32 +1,58 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from yatube.caches import versioned_timeout
+from yatube.routers import primary_sticky, replica_reads
+
+from . import feeds, follows, renditions, search, versions
+from .conditional import (conditional_page, group_scopes, index_scopes,
+                          post_scopes, profile_scopes)
+from .counters import stats_for
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User
+from .models import Follow, Group, Post, User
+from .pagination import CursorPaginator, page_key, paginate
 
 
+@replica_reads
+@conditional_page(index_scopes)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = feeds.index_feed()
+    page, paginator = paginate(request, post_list)
     return render(request, 'index.html',
-                  {'page': page, 'paginator': paginator})
+                  {'page': page, 'paginator': paginator,
+                   'feed_version': versions.feed_key(('index',))})
 
 
+@replica_reads
+@conditional_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts_list = group.posts.order_by("-pub_date").all()
-    paginator = Paginator(posts_list, 10)
-
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts_list = feeds.group_feed(group)
+    page, paginator = paginate(request, posts_list)
     return render(request, 'group.html',
-                  {'group': group, 'page': page, 'paginator': paginator})
+                  {'group': group, 'page': page, 'paginator': paginator,
+                   'feed_version': versions.feed_key(('group', group.pk))})
 
 
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    results = None
+    if query:
+        results = search.get_backend().search(
+            query, cursor=request.GET.get('after'),
+            limit=settings.POSTS_PER_PAGE)
+    posts = feeds.search_feed(results.post_ids) if results else []
+    return render(request, 'search.html', {'query': query,
+                                           'results': results,
+                                           'posts': posts})
+
+
+@primary_sticky
 @login_required
 def new_post(request):
     if request.method == 'POST':
@@ -34,42 +60,101 @@ def new_post(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            with transaction.atomic():
+                post.save()
+                if post.image:
+                    renditions.schedule(post)
             return redirect('index')
-        else:
-            render(request, 'new_post.html', {'form': form})
+        return render(request, 'new_post.html', {'form': form})
     form = PostForm()
     return render(request, 'new_post.html', {'form': form})
 
 
+@replica_reads
+@conditional_page(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
     user = request.user
     follow = False
     if user.is_authenticated:
-        follow = user.follower.filter(author=author).exists()
-    post_list = author.posts.order_by('-pub_date')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+        follow = author.pk in follows.following_ids(user)
+    post_list = feeds.profile_feed(author)
+    page, paginator = paginate(request, post_list)
     return render(request, 'profile.html', {'author': author,
+                                            'stats': stats_for(author),
                                             'page': page,
                                             'paginator': paginator,
                                             'follow': follow,
-                                            'user': user})
+                                            'user': user,
+                                            'feed_version': versions.feed_key(
+                                                ('author', author.pk))})
 
 
+@replica_reads
+@conditional_page(post_scopes)
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.posts, id=post_id)
+    post = get_object_or_404(
+        feeds.feed_posts().select_related('author__stats'),
+        author__username=username, id=post_id)
+    author = post.author
     form = CommentForm()
-    comments = post.comments.order_by("created")
     return render(request, 'post.html', {'author': author,
+                                         'stats': stats_for(author),
                                          'post': post,
                                          'form': form,
-                                         'comments': comments})
-
-
+                                         **comment_page(request, post)})
+
+
+def comment_page(request, post):
+    """Страница комментариев записи по курсору из ?after= или ?before=."""
+    order = request.GET.get('order')
+    if order not in ('oldest', 'newest'):
+        order = settings.COMMENTS_ORDER
+    paginator = CursorPaginator(feeds.comment_thread(post),
+                                settings.COMMENTS_PER_PAGE, field='created',
+                                descending=order == 'newest')
+    page = paginator.get_page(after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+    # Ссылки на соседние страницы строятся только из order и курсора,
+    # поэтому остальные параметры запроса в ключ не входят
+    page.cache_key = page_key(page)
+    page.cache_timeout = versioned_timeout(
+        settings.POSTS_PAGE_FRAGMENT_TIMEOUT)
+    return {'comments': page, 'comments_order': order,
+            'comments_version': versions.feed_key(('comments', post.pk))}
+
+
+@replica_reads
+def post_comments(request, username, post_id):
+    """Следующие страницы комментариев: фрагмент HTML или JSON."""
+    post = get_object_or_404(Post.objects.select_related('author'),
+                             author__username=username, id=post_id)
+    context = comment_page(request, post)
+    if request.GET.get('format') != 'json':
+        return render(request, 'comment_list.html', {'post': post,
+                                                     **context})
+    page = context['comments']
+    key = make_template_fragment_key('comments_json', [
+        context['comments_version'], post.pk, context['comments_order'],
+        page.cache_key])
+    data = cache.get(key)
+    if data is None:
+        data = {
+            'order': context['comments_order'],
+            'comments': [{'id': comment.pk,
+                          'author': comment.author.username,
+                          'text': comment.text,
+                          'created': comment.created.isoformat()}
+                         for comment in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        }
+        cache.set(key, data, page.cache_timeout)
+    return JsonResponse(data)
+
+
+@primary_sticky
 @login_required
 def post_edit(request, username, post_id):
     author = get_object_or_404(User, username=username)
@@ -79,7 +164,13 @@ def post_edit(request, username, post_id):
                         instance=post)
         if request.method == 'POST':
             if form.is_valid():
-                form.save()
+                image_changed = 'image' in form.changed_data
+                with transaction.atomic():
+                    if image_changed:
+                        renditions.discard(post)
+                    form.save()
+                    if image_changed and post.image:
+                        renditions.schedule(post)
                 return redirect('post_view', username, post_id)
         return render(request, 'post_edit.html', {'form': form,
                                                   'post': post})
@@ -87,6 +178,7 @@ def post_edit(request, username, post_id):
         return redirect('post_view', username, post_id)
 
 
+@primary_sticky
 @login_required
 def add_comment(request, username, post_id):
     author = get_object_or_404(User, username=username)
@@ -97,7 +189,8 @@ def add_comment(request, username, post_id):
             comment = form.save(commit=False)
             comment.author = request.user
             comment.post = post
-            comment.save()
+            with transaction.atomic():
+                comment.save()
     return redirect('post_view', username, post_id)
 
 
@@ -110,33 +203,35 @@ def server_error(request):
     return render(request, 'misc/500.html', status=500)
 
 
+@replica_reads
 @login_required
 def follow_index(request):
-    user = request.user
-    authors = user.follower.all().values('author')
-    post_list = Post.objects.filter(author__in=authors)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, 'follow.html', {'page': page,
-                                           'paginator': paginator})
+    post_list = feeds.follow_feed(request.user)
+    page, paginator = paginate(request, post_list)
+    return render(request, 'follow.html', {
+        'page': page,
+        'paginator': paginator,
+        'feed_version': versions.follow_key(request.user),
+    })
 
 
+@primary_sticky
 @login_required
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
-    follow_exsists = user.follower.filter(author=author).exists()
-    if user != author and follow_exsists is False:
-        follow = user.follower.create(author=author)
-        follow.save()
+    if user != author:
+        with transaction.atomic():
+            Follow.objects.get_or_create(user=user, author=author)
     return redirect('follow_index')
 
 
+@primary_sticky
 @login_required
 def profile_unfollow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
-    follows = user.follower.filter(author=author)
-    follows.delete()
+    subscriptions = user.follower.filter(author=author)
+    with transaction.atomic():
+        subscriptions.delete()
     return redirect('index')
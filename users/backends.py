@@ -0,0 +1,35 @@
+"""Пользователь сессии из кэша.
+
+AuthenticationMiddleware на каждый запрос загружает пользователя по id
+из сессии. CachedModelBackend хранит его в кэше USER_CACHE_TIMEOUT
+секунд; сигналы users.signals удаляют запись при сохранении и удалении
+пользователя (в том числе при смене пароля) и при выходе. Сигналы
+чистят кэш только своего процесса, поэтому без общего кэша
+(yatube.caches.is_shared) пользователь читается из базы.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from yatube.caches import is_shared
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not is_shared():
+            return super().get_user(user_id)
+        key = user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,45 @@
+from functools import lru_cache
+
+# Формы для 1, 2 и 5 предметов у слов, которые выводят шаблоны
+PRECOMPUTED = {
+    'комментарий': ('комментарий', 'комментария', 'комментариев'),
+    'подписчик': ('подписчик', 'подписчика', 'подписчиков'),
+    'запись': ('запись', 'записи', 'записей'),
+}
+
+_morph = None
+
+
+def get_morph():
+    """Анализатор pymorphy2, загружаемый при первом обращении."""
+    global _morph
+    if _morph is None:
+        import pymorphy2
+        _morph = pymorphy2.MorphAnalyzer()
+    return _morph
+
+
+def number_class(count):
+    """Класс числа: 0 — «1 запись», 1 — «2 записи», 2 — «5 записей»."""
+    count = abs(int(count))
+    if count % 10 == 1 and count % 100 != 11:
+        return 0
+    if 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        return 1
+    return 2
+
+
+@lru_cache(maxsize=None)
+def plural_forms(word):
+    if word in PRECOMPUTED:
+        return PRECOMPUTED[word]
+    parsed = get_morph().parse(word)[0]
+    forms = []
+    for count in (1, 2, 5):
+        agreed = parsed.make_agree_with_number(count)
+        forms.append(agreed.word if agreed is not None else word)
+    return tuple(forms)
+
+
+def agree_with_number(count, word):
+    return plural_forms(word)[number_class(count)]
@@ -0,0 +1,33 @@
+"""Сессии в кэше, если он общий для всех процессов.
+
+С общим кэшем это cached_db: сессия читается из кэша, а пишется и в кэш,
+и в базу. LocMemCache у каждого процесса свой, и выход из сессии в одном
+процессе не удалил бы ее из кэша других, поэтому с ним сессия читается и
+пишется только в базе, как в sessions.backends.db. Бэкенд кэша
+проверяется при каждом вызове (yatube.caches.is_shared).
+"""
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db, db
+
+from yatube.caches import is_shared
+
+
+def _shared():
+    return is_shared(settings.SESSION_CACHE_ALIAS)
+
+
+class SessionStore(cached_db.SessionStore):
+    def load(self):
+        if _shared():
+            return super().load()
+        return db.SessionStore.load(self)
+
+    def exists(self, session_key):
+        if _shared():
+            return super().exists(session_key)
+        return db.SessionStore.exists(self, session_key)
+
+    def save(self, must_create=False):
+        if _shared():
+            return super().save(must_create)
+        return db.SessionStore.save(self, must_create)
@@ -1,7 +1,6 @@
-import pymorphy2
 from django import template
 
-morph = pymorphy2.MorphAnalyzer()
+from ..declension import agree_with_number
 
 register = template.Library()
 
@@ -10,7 +9,7 @@ register = template.Library()
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
 
+
 @register.simple_tag
 def declension(count, word):
-    zero_word = morph.parse(word)[0]
-    return zero_word.make_agree_with_number(count).word
+    return agree_with_number(count, word)
@@ -1,7 +1,21 @@
+import os
+import tempfile
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from posts import follows
+from posts.models import Follow, Post
+from yatube.testing import TestCase
+
+from .backends import user_key
+from .declension import PRECOMPUTED, agree_with_number, get_morph
+
 User = get_user_model()
 
 
@@ -44,3 +58,123 @@ class TestRegistration(TestCase):
             'username': self.data['username']}))
         self.assertEqual(response.status_code, 200,
                          msg='Профиль пользователя не создается')
+
+
+class TestDeclension(TestCase):
+    def test_number_classes(self):
+        cases = {0: 'записей', 1: 'запись', 3: 'записи', 5: 'записей',
+                 11: 'записей', 12: 'записей', 21: 'запись', 22: 'записи',
+                 111: 'записей', 1001: 'запись'}
+        for count, expected in cases.items():
+            with self.subTest(count=count):
+                self.assertEqual(agree_with_number(count, 'запись'),
+                                 expected, msg='Неверная форма слова')
+
+    def test_precomputed_match_analyzer(self):
+        morph = get_morph()
+        for word, forms in PRECOMPUTED.items():
+            parsed = morph.parse(word)[0]
+            for count, form in zip((1, 2, 5), forms):
+                with self.subTest(word=word, count=count):
+                    self.assertEqual(
+                        parsed.make_agree_with_number(count).word, form,
+                        msg='Таблица форм расходится с pymorphy2')
+
+    def test_unknown_word_uses_analyzer(self):
+        self.assertEqual(agree_with_number(5, 'сообщество'), 'сообществ')
+
+
+# Кэш в файлах общий для процессов, и с ним кэш сессий и пользователей
+# включается
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'yatube-test-cache'),
+}})
+class TestIdentityCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author',
+                                               password='password')
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.user.follower.create(author=self.author)
+        Post.objects.create(text='Post', author=self.author)
+        self.client.login(username='bum', password='password')
+
+    def get_queries(self, name, **kwargs):
+        url = reverse(name, kwargs=kwargs)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['user'], self.user)
+        return [query['sql'] for query in queries]
+
+    def test_warm_cache_has_no_identity_queries(self):
+        pages = [('index', {}), ('follow_index', {}),
+                 ('profile', {'username': 'author'})]
+        for name, kwargs in pages:
+            with self.subTest(page=name):
+                for sql in self.get_queries(name, **kwargs):
+                    self.assertNotIn('django_session', sql,
+                                     msg='Сессия читается из базы')
+                    self.assertNotIn('FROM "auth_user" WHERE '
+                                     '"auth_user"."id"', sql,
+                                     msg='Пользователь читается из базы')
+                    self.assertNotIn('posts_follow', sql,
+                                     msg='Подписки читаются из базы')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'yatube.metrics.InstrumentedLocMemCache'}})
+    def test_local_cache_is_not_used(self):
+        self.client.get(reverse('index'))
+        self.assertIsNone(cache.get(user_key(self.user.pk)),
+                          msg='Пользователь в кэше процесса')
+        self.assertTrue(any('django_session' in sql
+                            for sql in self.get_queries('index')),
+                        msg='Сессия не читается из базы')
+
+    def test_user_save_resets_cache(self):
+        self.get_queries('index')
+        self.assertIsNotNone(cache.get(user_key(self.user.pk)))
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertIsNone(cache.get(user_key(self.user.pk)),
+                          msg='Пользователь в кэше после смены пароля')
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.context['user'].is_authenticated,
+                         msg='Сессия действует после смены пароля')
+
+    def test_logout_resets_cache(self):
+        self.get_queries('index')
+        self.client.get(reverse('logout'))
+        self.assertIsNone(cache.get(user_key(self.user.pk)),
+                          msg='Пользователь в кэше после выхода')
+
+    def test_stale_following_set_does_not_lose_follow(self):
+        self.assertIn(self.author.pk, follows.following_ids(self.user))
+        # Отписка в другом процессе: кэш этого процесса не очищен
+        with mock.patch('posts.follows.forget'):
+            Follow.objects.filter(user=self.user).delete()
+        self.client.post(reverse('profile_follow', kwargs={
+            'username': 'author'}))
+        self.assertTrue(
+            Follow.objects.filter(user=self.user, author=self.author).exists(),
+            msg='Подписка потеряна из-за устаревшего кэша')
+
+
+class TestProcessLocalCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bum',
+                                             password='password')
+        self.client.login(username='bum', password='password')
+
+    def test_user_not_cached(self):
+        self.client.get(reverse('index'))
+        self.assertIsNone(cache.get(user_key(self.user.pk)),
+                          msg='Пользователь в кэше памяти процесса')
+        # Блокировка в другом процессе: сигналы здесь не сработают
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.context['user'].is_authenticated,
+                         msg='Сессия действует после блокировки')
@@ -0,0 +1,20 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named
+``application``. Django 2.2 has no ASGI support of its own, so the
+handler comes from yatube.handlers: requests run in a bounded thread
+pool, network I/O runs in the event loop.
+
+Run with any ASGI server, e.g.::
+
+    uvicorn yatube.asgi:application
+"""
+
+import os
+
+from yatube.handlers import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+application = get_asgi_application()
@@ -0,0 +1,93 @@
+"""SQLite для работы под нагрузкой: WAL, прагмы и постоянные соединения.
+
+Отличия от django.db.backends.sqlite3:
+
+- при открытии соединения выполняются прагмы PRAGMAS (WAL, mmap, кэш
+  страниц, ожидание блокировки); их можно переопределить в
+  OPTIONS['pragmas']. В режиме WAL читатели не ждут писателей;
+- OPTIONS['transaction_mode'] (например, 'IMMEDIATE') задает вид BEGIN
+  для transaction.atomic. BEGIN IMMEDIATE сразу берет блокировку записи
+  и ждет ее busy_timeout, а не падает с «database is locked», когда
+  читающая транзакция пытается начать писать;
+- при CONN_HEALTH_CHECKS соединение, пережившее запрос (CONN_MAX_AGE),
+  перед первым использованием в следующем запросе проверяется: отвечает
+  ли оно и не подменен ли файл базы (например, при восстановлении из
+  копии). Непригодное соединение открывается заново.
+"""
+import os
+
+from django.db.backends.sqlite3 import base
+from django.db.backends.sqlite3.base import Database
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, только последние
+    # транзакции при отключении питания
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер в КиБ
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+OPTIONS = ('pragmas', 'transaction_mode')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.inode = None
+
+    @property
+    def pragmas(self):
+        return {**PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for name in OPTIONS:
+            params.pop(name, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        self.inode = self._current_inode()
+        self.health_check_done = True
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
+
+    def _current_inode(self):
+        if self.is_in_memory_db():
+            return None
+        try:
+            return os.stat(self.settings_dict['NAME']).st_ino
+        except OSError:
+            return None
+
+    def is_usable(self):
+        if self._current_inode() != self.inode:
+            return False
+        try:
+            self.connection.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def _cursor(self, name=None):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not self.in_atomic_block):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        return super()._cursor(name)
@@ -0,0 +1,22 @@
+"""Общий ли кэш по умолчанию для всех процессов сервера.
+
+LocMemCache у каждого процесса свой: ключ, записанный или удаленный в
+одном процессе, другие не видят. Данные, устаревание которых
+отслеживается сменой версии в кэше (posts.versions), в таком кэше живут
+не дольше LOCAL_CACHE_TIMEOUT. Проверка идет по настроенному бэкенду при
+каждом вызове, поэтому действует и подмена CACHES в тестах.
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(alias=DEFAULT_CACHE_ALIAS):
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def versioned_timeout(timeout):
+    """Срок для ключа, который сбрасывает смена версии в кэше."""
+    if is_shared():
+        return timeout
+    return min(timeout, settings.LOCAL_CACHE_TIMEOUT)
@@ -0,0 +1,255 @@
+"""Метрики запросов: гистограммы в памяти процесса и их выгрузка.
+
+MetricsMiddleware (yatube.middleware) собирает по каждому запросу время,
+число и время запросов к базе, попадания в кэш, время отрисовки шаблонов
+и размер ответа. Значения копятся в гистограммах текущего процесса и
+отдаются в текстовом формате Prometheus по адресу /metrics/ с токеном
+METRICS_TOKEN (Authorization: Bearer) или сотрудникам сайта. Адрес
+клиента не проверяется: за обратным прокси все запросы приходят с
+127.0.0.1. У каждого процесса сервера свои гистограммы: Prometheus
+собирает их с каждого процесса отдельно.
+"""
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import MemcachedCache
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+DURATION_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+                    2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+_MISSING = object()
+
+
+class Histogram:
+    """Гистограмма Prometheus: счетчики по верхним границам корзин."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+
+    def observe(self, name, value, buckets, labels):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value, labels):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        lines = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',),
+                                    histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket'
+                             f'{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + [(key, str(value)) for key, value in extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, value.replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in pairs) + '}'
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    """Счетчики одного запроса, доступные через current()."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0
+        self._rendering = 0
+
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def collect():
+    metrics = _local.metrics = RequestMetrics()
+    try:
+        yield metrics
+    finally:
+        _local.metrics = None
+
+
+def record_query(execute, sql, params, many, context):
+    """Обертка connection.execute_wrapper: время и число запросов."""
+    metrics = current()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def observe_request(metrics, view, response_size):
+    labels = (('view', view),)
+    registry.observe('yatube_request_duration_seconds',
+                     time.perf_counter() - metrics.started,
+                     DURATION_BUCKETS, labels)
+    registry.observe('yatube_db_queries', metrics.db_queries,
+                     COUNT_BUCKETS, labels)
+    registry.observe('yatube_db_duration_seconds', metrics.db_time,
+                     DURATION_BUCKETS, labels)
+    registry.observe('yatube_template_duration_seconds',
+                     metrics.template_time, DURATION_BUCKETS, labels)
+    if response_size is not None:
+        registry.observe('yatube_response_size_bytes', response_size,
+                         SIZE_BUCKETS, labels)
+    registry.inc('yatube_cache_hits_total', metrics.cache_hits, labels)
+    registry.inc('yatube_cache_misses_total', metrics.cache_misses, labels)
+
+
+class CacheMetricsMixin:
+    """Считает попадания и промахи get и get_many текущего запроса."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        metrics = current()
+        if metrics is not None and not getattr(_local, 'in_get_many', False):
+            if value is _MISSING:
+                metrics.cache_misses += 1
+            else:
+                metrics.cache_hits += 1
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        _local.in_get_many = True
+        try:
+            values = super().get_many(keys, version)
+        finally:
+            _local.in_get_many = False
+        metrics = current()
+        if metrics is not None:
+            metrics.cache_hits += len(values)
+            metrics.cache_misses += len(keys) - len(values)
+        return values
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedMemcachedCache(CacheMetricsMixin, MemcachedCache):
+    pass
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None:
+            return super().render(context, request)
+        # Вложенные вызовы render не учитываются второй раз
+        metrics._rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._rendering -= 1
+            if not metrics._rendering:
+                metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django с замером времени отрисовки для метрик."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def is_trusted(request, load_user=True):
+    """Запрос сотрудника сайта или с токеном METRICS_TOKEN.
+
+    С ``load_user=False`` пользователь проверяется, только если он уже
+    загружен или у запроса есть cookie сессии: иначе проверка сама
+    загружала бы сессию и пользователя для каждого ответа.
+    """
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and hmac.compare_digest(header, f'Bearer {token}'):
+        return True
+    if not (load_user or hasattr(request, '_cached_user')
+            or settings.SESSION_COOKIE_NAME in request.COOKIES):
+        return False
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    if not is_trusted(request):
+        raise Http404
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
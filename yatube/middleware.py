@@ -0,0 +1,45 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса и добавляет заголовок Server-Timing.
+
+    Стоит первым в MIDDLEWARE, чтобы время включало все остальные
+    обработчики. Замер накладных расходов: python -m benchmarks.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with metrics.collect() as collected, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.record_query))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        size = None if response.streaming else len(response.content)
+        metrics.observe_request(collected, view, size)
+        if (settings.METRICS_SERVER_TIMING
+                or metrics.is_trusted(request, load_user=False)):
+            response['Server-Timing'] = server_timing(collected)
+        return response
+
+
+def server_timing(collected):
+    total = time.perf_counter() - collected.started
+    return ', '.join((
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={collected.db_time * 1000:.1f};'
+        f'desc="{collected.db_queries} queries"',
+        f'cache;desc="hit={collected.cache_hits} '
+        f'miss={collected.cache_misses}"',
+        f'tpl;dur={collected.template_time * 1000:.1f}',
+    ))
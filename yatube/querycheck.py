@@ -0,0 +1,136 @@
+"""Разбор SQL-запросов запроса: повторы (N+1) и медленные запросы.
+
+Запросы группируются по «форме» — тексту SQL без значений и с
+одинаковыми списками IN. Если одна форма повторяется не меньше
+QUERYCHECK_REPEAT_THRESHOLD раз, это почти всегда запрос на каждую строку
+в цикле шаблона или представления.
+
+- QueryCheckMiddleware в работе: медленные запросы пишет в лог на каждом
+  запросе, повторы — на доле QUERYCHECK_SAMPLE_RATE запросов.
+- query_budget в тестах: падает, если представление сделало больше
+  запросов, чем заявлено, или повторило форму запроса.
+"""
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ContextDecorator, ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('yatube.querycheck')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def shape(sql):
+    """SQL без литералов: запросы, отличающиеся только значениями, равны."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Обертка для connection.execute_wrapper, запоминающая запросы."""
+
+    def __init__(self, shapes=True):
+        self.shapes = Counter() if shapes else None
+        self.count = 0
+        self.slow = []
+        self.slow_threshold = settings.QUERYCHECK_SLOW_QUERY_MS / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            if self.shapes is not None:
+                self.shapes[shape(sql)] += 1
+            if duration >= self.slow_threshold:
+                self.slow.append((duration, sql))
+
+    def repeated(self, threshold=None):
+        """Формы запросов, повторенные не меньше threshold раз."""
+        threshold = threshold or settings.QUERYCHECK_REPEAT_THRESHOLD
+        return [(sql, count) for sql, count in self.shapes.most_common()
+                if count >= threshold]
+
+    def record(self):
+        """Контекст, в котором записываются запросы ко всем базам."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def report(self):
+        lines = [f'{count} x {sql}'
+                 for sql, count in self.shapes.most_common()]
+        return '\n'.join(lines)
+
+
+class QueryCheckMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.QUERYCHECK_SAMPLE_RATE
+        recorder = QueryRecorder(shapes=sampled)
+        with recorder.record():
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        for duration, sql in recorder.slow:
+            logger.warning('Медленный запрос в %s: %.1f мс: %s', view,
+                           duration * 1000, sql)
+        if sampled:
+            for sql, count in recorder.repeated():
+                logger.warning('Возможный N+1 в %s: %d раз: %s', view,
+                               count, sql)
+        return response
+
+
+class query_budget(ContextDecorator):
+    """Проверка числа запросов для тестов.
+
+    Как контекст или декоратор метода теста::
+
+        with query_budget(4):
+            self.client.get(url)
+
+    Падает с AssertionError и списком форм запросов, если запросов больше
+    ``budget`` или какая-то форма повторилась ``repeat_threshold`` раз.
+    """
+
+    def __init__(self, budget, repeat_threshold=None):
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+
+    def __enter__(self):
+        self.recorder = QueryRecorder()
+        self.stack = self.recorder.record()
+        self.stack.__enter__()
+        return self.recorder
+
+    def __exit__(self, *exc_info):
+        self.stack.__exit__(*exc_info)
+        if exc_info[0] is not None:
+            return False
+        recorder = self.recorder
+        if recorder.count > self.budget:
+            raise AssertionError(
+                f'Запросов {recorder.count}, бюджет {self.budget}:\n'
+                f'{recorder.report()}')
+        repeated = recorder.repeated(self.repeat_threshold)
+        if repeated:
+            raise AssertionError(
+                'Повторяющиеся запросы (N+1):\n' + '\n'.join(
+                    f'{count} x {sql}' for sql, count in repeated))
+        return False
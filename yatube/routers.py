@@ -0,0 +1,149 @@
+"""Чтение лент с реплики, запись — в основную базу.
+
+Все запросы идут в default, кроме чтения внутри представлений с
+декоратором replica_reads: их PrimaryReplicaRouter отправляет в
+REPLICA_DATABASE. Реплика используется, только если она догнала основную
+базу (replica_is_fresh), иначе запрос целиком читает основную: фрагменты
+в кэше с версией в ключе, отрисованные по отставшей реплике, остались бы
+устаревшими навсегда.
+
+Пользователь, который только что что-то изменил, должен сразу видеть
+свои изменения. Представления с декоратором primary_sticky после записи
+ставят cookie REPLICA_STICKY_COOKIE на REPLICA_STICKY_SECONDS, и пока она
+есть, replica_reads читает основную базу.
+
+Локально репликой служит второй файл SQLite, который копирует команда
+replicate (функция replicate). Она же оставляет рядом файл-отметку: время
+начала копии записано в его mtime, а время последней записи в основную
+базу — это mtime ее файла или журнала WAL. Оба времени берутся с часов
+файловой системы, поэтому сравнивать их можно без поправок.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Сессии читаются из основной базы, даже если реплика отстает
+PRIMARY_APPS = {'sessions'}
+
+_local = threading.local()
+
+
+def synced_marker(name):
+    return name + '.synced'
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def replicate(primary, replica):
+    """Копирует файл SQLite primary в replica через backup API.
+
+    Копия согласована: backup читает основную базу в одной транзакции,
+    а читатели реплики ждут окончания записи. Отметка создается до
+    копирования, поэтому запись, сделанная во время копирования, сочтется
+    не попавшей в реплику.
+    """
+    marker = synced_marker(replica)
+    pending = marker + '.tmp'
+    with open(pending, 'w'):
+        pass
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    os.replace(pending, marker)
+
+
+def is_synced(primary, replica):
+    synced = _mtime(synced_marker(replica))
+    written = _mtime(primary)
+    if synced is None or written is None:
+        return False
+    # Строго меньше: часы файловой системы грубые, и запись в ту же
+    # единицу времени могла случиться уже после копирования
+    return max(written, _mtime(primary + '-wal') or 0) < synced
+
+
+def replica_is_fresh():
+    """Есть ли в реплике все записи основной базы."""
+    primary = settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']
+    replica = settings.DATABASES.get(settings.REPLICA_DATABASE)
+    if replica is None or replica['NAME'] == primary:
+        return False
+    return is_synced(primary, replica['NAME'])
+
+
+def reading_replica():
+    return getattr(_local, 'replica', False)
+
+
+@contextmanager
+def replica():
+    previous = reading_replica()
+    _local.replica = True
+    try:
+        yield
+    finally:
+        _local.replica = previous
+
+
+def replica_reads(view):
+    """Чтение представления с реплики, если она свежая и нет cookie."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (settings.REPLICA_STICKY_COOKIE in request.COOKIES
+                or not replica_is_fresh()):
+            return view(request, *args, **kwargs)
+        with replica():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def primary_sticky(view):
+    """После записи в базу читать основную базу REPLICA_STICKY_SECONDS."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        previous = getattr(_local, 'written', False)
+        _local.written = False
+        try:
+            response = view(request, *args, **kwargs)
+            if _local.written and response.status_code < 400:
+                response.set_cookie(
+                    settings.REPLICA_STICKY_COOKIE, '1',
+                    max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+                    samesite='Lax')
+            return response
+        finally:
+            _local.written = previous
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (reading_replica()
+                and model._meta.app_label not in PRIMARY_APPS):
+            return settings.REPLICA_DATABASE
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _local.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема реплики приходит вместе с копией основной базы
+        return db == DEFAULT_DB_ALIAS
@@ -16,6 +16,7 @@ ALLOWED_HOSTS = [
 INSTALLED_APPS = [
     'users',
     'posts',
+    'jobs',
     'django.contrib.sites',
     'django.contrib.flatpages',
     'django.contrib.admin',
@@ -29,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.middleware.MetricsMiddleware',
+    'yatube.querycheck.QueryCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,7 +46,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -59,14 +62,45 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
+# Потоков, в которых yatube.asgi выполняет запросы: столько запросов
+# одновременно обращаются к базе
+ASGI_THREADS = 8
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 с WAL и прагмами, см. yatube/backends/sqlite3/base.py
+        'ENGINE': 'yatube.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение живет между запросами и проверяется перед первым
+        # запросом к базе
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Копия default для чтения лент, см. yatube/routers.py. Локально ее
+    # обновляет python manage.py replicate
+    'replica': {
+        'ENGINE': 'yatube.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': {'query_only': 1},
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['yatube.routers.PrimaryReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# Сколько секунд после записи пользователь читает основную базу
+REPLICA_STICKY_COOKIE = 'primary'
+REPLICA_STICKY_SECONDS = 30
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.'
@@ -106,6 +140,97 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Posts
+
+# 'cursor' — навигация по ключу (pub_date, id) без COUNT(*) и OFFSET,
+# 'pages' — прежняя навигация по номерам страниц.
+POSTS_PAGINATION = 'cursor'
+POSTS_PER_PAGE = 10
+# Комментарии под записью: по курсору (created, id), 'oldest' или 'newest'
+COMMENTS_PER_PAGE = 50
+COMMENTS_ORDER = 'oldest'
+
+# Записи авторов, у которых подписчиков больше порога, не раскладываются
+# по лентам подписчиков при публикации, а добавляются в ленту при чтении.
+TIMELINE_FANOUT_THRESHOLD = 1000
+TIMELINE_BATCH_SIZE = 1000
+
+# Страницы для анонимных посетителей отдаются с ETag и Last-Modified;
+# общий кэш (обратный прокси) может отдавать их без проверки столько секунд
+POSTS_HTTP_SHARED_MAX_AGE = 10
+
+# Ключ фрагмента меняется вместе с записью, срок нужен только для очистки
+POST_FRAGMENT_TIMEOUT = 60 * 60 * 24 * 7
+# Страницы лент в кэше фрагментов: ключ меняется с версией ленты
+POSTS_PAGE_FRAGMENT_TIMEOUT = 60 * 60
+# Версии лент (posts.versions) живут не меньше фрагментов с ними в ключе
+FEED_VERSION_TIMEOUT = POST_FRAGMENT_TIMEOUT
+# Кэш в памяти процесса (LocMemCache) не видит версий, измененных в других
+# процессах, поэтому версии и фрагменты хранятся в нем не дольше этого
+# срока (см. yatube.caches)
+LOCAL_CACHE_TIMEOUT = 30
+
+# Копии картинок записей, которые готовятся после сохранения записи.
+# Каждая копия сохраняется в нескольких ширинах для srcset и в форматах
+# из POST_IMAGE_FORMATS, которые поддерживает Pillow, плюс JPEG.
+# Копии пишутся по путям в MEDIA_ROOT, поэтому готовятся только при
+# хранении файлов в FileSystemStorage; с другим хранилищем (S3 и т. п.)
+# шаблоны показывают оригинал.
+POST_IMAGE_RENDITIONS = {
+    'feed': {'size': (1060, 539), 'crop': True,
+             'widths': (360, 720, 1060)},
+    'detail': {'size': (1600, 1600), 'crop': False,
+               'widths': (800, 1600)},
+    'small': {'size': (320, 163), 'crop': True, 'widths': (320,)},
+}
+POST_IMAGE_FORMATS = ('avif', 'webp')
+POST_IMAGE_SIZES = '(max-width: 1060px) 100vw, 1060px'
+POST_IMAGE_QUALITY = 85
+
+# Загрузка картинок: файл сразу пишется во временный файл, размеры
+# проверяются по заголовку, оригинал уменьшается и пересохраняется без EXIF
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_SIZE = (2560, 2560)
+# Копии готовятся фоновой задачей (manage.py run_jobs), а не в запросе
+POST_IMAGE_ASYNC = True
+
+# Фоновые задачи (jobs.queue). Обработчик: python manage.py run_jobs
+JOBS_PROCESSES = 2
+# Столько секунд забранная задача невидима другим обработчикам
+JOBS_VISIBILITY_TIMEOUT = 300
+JOBS_MAX_ATTEMPTS = 5
+# Задержка перед повтором, удваивается с каждой попыткой
+JOBS_RETRY_DELAY = 10
+
+# Полнотекстовый поиск. На SQLite — индекс FTS5 из миграции 0025, для
+# других баз — posts.search.LikeSearchBackend или свой движок.
+POSTS_SEARCH_BACKEND = 'posts.search.SqliteSearchBackend'
+# Релевантность делится на 1 + возраст записи в таких днях: через 30 дней
+# она падает вдвое, через 60 — втрое (гиперболическое, не экспоненциальное
+# затухание)
+POSTS_SEARCH_DECAY_DAYS = 30
+
+# Списки в админке не считают COUNT(*) по таблицам больше порога,
+# а оценивают число строк (posts.pagination.EstimatedCountPaginator)
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Метрики запросов (yatube.middleware.MetricsMiddleware): заголовок
+# Server-Timing во всех ответах только при отладке, иначе — сотрудникам и
+# запросам с токеном. /metrics/ отдается с заголовком
+# Authorization: Bearer METRICS_TOKEN или сотрудникам
+METRICS_SERVER_TIMING = DEBUG
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Проверка SQL (yatube.querycheck): запросы дольше порога пишутся в лог
+# всегда, повторы одной формы запроса (N+1) ищутся в доле запросов
+QUERYCHECK_SLOW_QUERY_MS = 100
+QUERYCHECK_REPEAT_THRESHOLD = 5
+QUERYCHECK_SAMPLE_RATE = 0.01
+
 # Login
 
 LOGIN_URL = '/auth/login/'
@@ -126,10 +251,35 @@ SITE_ID = 2
 
 CACHES = {
         'default': {
-                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'BACKEND': 'yatube.metrics.InstrumentedLocMemCache',
         }
 }
 
+# Сессия, пользователь сессии и его подписки могут браться из кэша
+# (users.sessions, users.backends, posts.follows), и тогда запрос с теплым
+# кэшем не обращается к базе за сессией и пользователем. Это безопасно
+# только с общим кэшем: LocMemCache у каждого процесса свой, и процесс не
+# узнал бы, что в другом сменили пароль, заблокировали пользователя или
+# вышли из сессии. Поэтому с LocMemCache выше этот кэш ВЫКЛЮЧЕН и все это
+# читается из базы. Чтобы включить его, достаточно общего кэша, например
+# Memcached (pip install python-memcached):
+#
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'yatube.metrics.InstrumentedMemcachedCache',
+#         'LOCATION': '127.0.0.1:11211',
+#     }
+# }
+#
+# Бэкенд проверяется при каждом обращении (yatube.caches.is_shared).
+SESSION_ENGINE = 'users.sessions'
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    # Для сессий, созданных до CachedModelBackend
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_TIMEOUT = 300
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""TestCase, в котором выполняются функции transaction.on_commit.
+
+django.test.TestCase держит каждый тест в транзакции, которая не
+фиксируется, поэтому отложенные до фиксации функции (смена версий лент,
+счетчики, раскладка по лентам) в нем не выполняются. Здесь они
+выполняются как в работе: вне atomic() теста — сразу, как при
+автофиксации, а из вложенного atomic() — при успешном выходе из него или
+после запроса тестового клиента. Отложенные функции отката внутреннего
+atomic() Django отбрасывает сам.
+"""
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test import TestCase as DjangoTestCase
+
+
+def run_commit_hooks(using=DEFAULT_DB_ALIAS):
+    """Выполняет отложенные функции, как при фиксации транзакции."""
+    connection = connections[using]
+    while connection.run_on_commit:
+        _, func = connection.run_on_commit.pop(0)
+        func()
+
+
+class CommitClient(Client):
+    def request(self, **request):
+        response = super().request(**request)
+        run_commit_hooks()
+        return response
+
+
+class TestCase(DjangoTestCase):
+    client_class = CommitClient
+
+    def _fixture_setup(self):
+        super()._fixture_setup()
+        connection = connections[DEFAULT_DB_ALIAS]
+        # Глубина atomic() самого TestCase: на ней транзакция теста
+        # ведет себя как автофиксация
+        depth = len(connection.savepoint_ids)
+        defer = connection.on_commit
+
+        def on_commit(func):
+            if len(connection.savepoint_ids) > depth:
+                defer(func)
+            else:
+                func()
+
+        exit_atomic = transaction.Atomic.__exit__
+
+        def __exit__(atomic, exc_type, exc_value, traceback):
+            exit_atomic(atomic, exc_type, exc_value, traceback)
+            if (exc_type is None and atomic.using in (None, DEFAULT_DB_ALIAS)
+                    and len(connection.savepoint_ids) == depth):
+                run_commit_hooks()
+
+        self._patches = [
+            mock.patch.object(connection, 'on_commit', on_commit),
+            mock.patch.object(transaction.Atomic, '__exit__', __exit__),
+        ]
+        for patch in self._patches:
+            patch.start()
+
+    def _fixture_teardown(self):
+        for patch in reversed(self._patches):
+            patch.stop()
+        connections[DEFAULT_DB_ALIAS].run_on_commit = []
+        super()._fixture_teardown()
@@ -4,6 +4,8 @@ from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from . import metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
 
@@ -19,6 +21,8 @@ urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
 
+    path("metrics/", metrics.metrics_view, name="metrics"),
+
     path("", include("posts.urls")),
 ]
 